@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from common.security import decode_token
 from typing import Optional
@@ -54,6 +54,37 @@ async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCrede
     }
 
 
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    access_token: Optional[str] = Query(None, description="For EventSource clients that can't send headers")
+) -> dict:
+    """Like get_current_user, but also accepts the token as a query parameter."""
+    token = credentials.credentials if credentials else access_token
+    payload = decode_token(token) if token else None
+    
+    if not payload or payload.get("type") != "access":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
+    return {
+        "user_id": payload.get("sub"),
+        "email": payload.get("email"),
+        "role": payload.get("role")
+    }
+
+
+async def require_admin_stream(current_user: dict = Depends(get_stream_user)) -> dict:
+    if current_user["role"] != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to perform this action"
+        )
+    return current_user
+
+
 class RoleChecker:
     def __init__(self, allowed_roles: list):
         self.allowed_roles = allowed_roles
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from common.database import get_collection
+from common.events import PROCESS_ID
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "job_leases"
+
+
+def acquire_lease(name: str, ttl_seconds: float) -> bool:
+    """Take or renew the cluster-wide lease ``name`` for this process."""
+    now = datetime.utcnow()
+    try:
+        get_collection(LEASES_COLLECTION).find_one_and_update(
+            {"_id": name, "$or": [{"owner": PROCESS_ID}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": PROCESS_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another process holds an unexpired lease, so the upsert collided.
+        return False
+    return True
+
+
+def release_lease(name: str) -> None:
+    get_collection(LEASES_COLLECTION).delete_one({"_id": name, "owner": PROCESS_ID})
+
+
+class PeriodicTask:
+    """Runs ``fn()`` every ``interval`` seconds on a daemon thread.
+
+    With ``singleton=True`` only the replica holding the task's lease runs
+    it, so jobs that scan or rewrite shared collections don't run N times.
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], None], singleton: bool = False):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.singleton = singleton
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"task-{self.name}", daemon=True)
+        self._thread.start()
+        _tasks[self.name] = self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+        if self.singleton:
+            try:
+                release_lease(self.name)
+            except PyMongoError:
+                pass
+        _tasks.pop(self.name, None)
+
+    def run_once(self) -> None:
+        if self.singleton and not acquire_lease(self.name, self.interval * 3):
+            return
+        started = time.perf_counter()
+        try:
+            self.fn()
+            self.last_error = None
+        except Exception as exc:
+            self.failures += 1
+            self.last_error = repr(exc)
+            logger.exception("Periodic task %s failed", self.name)
+        finally:
+            self.runs += 1
+            self.last_run_at = datetime.utcnow()
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except PyMongoError:
+                logger.exception("Periodic task %s could not take its lease", self.name)
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "singleton": self.singleton,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_duration_ms": self.last_duration_ms,
+            "last_error": self.last_error
+        }
+
+
+_tasks: Dict[str, PeriodicTask] = {}
+
+register_collector("tasks", lambda: {name: task.stats() for name, task in list(_tasks.items())})
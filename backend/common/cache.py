@@ -0,0 +1,487 @@
+import asyncio
+import functools
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bson import Binary
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class EvictionPolicy(str, Enum):
+    LRU = "lru"
+    LFU = "lfu"
+    # Evicts the entry that expires first; entries without a TTL go last.
+    TTL = "ttl"
+
+
+class L2Backend(ABC):
+    """Second-level store shared by every worker and replica.
+
+    Values are stored as pickled bytes under ``namespace`` (the cache name).
+    ``get`` returns the payload with its remaining TTL in seconds (``None``
+    when it never expires).
+    """
+
+    name = "l2"
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, payload: bytes, ttl: Optional[float]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, namespace: str) -> None:
+        ...
+
+
+class MongoCacheBackend(L2Backend):
+    name = "mongo"
+
+    def __init__(self, collection_name: str = "cache_entries"):
+        self.collection_name = collection_name
+        self._indexed = False
+
+    def _collection(self):
+        collection = get_collection(self.collection_name)
+        if not self._indexed:
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            collection.create_index("namespace")
+            self._indexed = True
+        return collection
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        doc = self._collection().find_one({"_id": f"{namespace}:{key}"}, {"value": 1, "expires_at": 1})
+        if not doc:
+            return None
+        remaining = None
+        if doc.get("expires_at"):
+            # The TTL monitor only runs once a minute, so check expiry here too.
+            remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+            if remaining <= 0:
+                return None
+        return bytes(doc["value"]), remaining
+
+    def set(self, namespace: str, key: str, payload: bytes, ttl: Optional[float]) -> None:
+        self._collection().replace_one(
+            {"_id": f"{namespace}:{key}"},
+            {
+                "namespace": namespace,
+                "value": Binary(payload),
+                "expires_at": datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+            },
+            upsert=True
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._collection().delete_one({"_id": f"{namespace}:{key}"})
+
+    def clear(self, namespace: str) -> None:
+        self._collection().delete_many({"namespace": namespace})
+
+
+class SQLiteCacheBackend(L2Backend):
+    """Local key-value stand-in for workers sharing one host."""
+
+    name = "sqlite"
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if not row:
+            return None
+        remaining = row[1] - time.time() if row[1] is not None else None
+        if remaining is not None and remaining <= 0:
+            return None
+        return row[0], remaining
+
+    def set(self, namespace: str, key: str, payload: bytes, ttl: Optional[float]) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, payload, time.time() + ttl if ttl else None)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "frequency")
+
+    def __init__(self, value: Any, size: int, expires_at: Optional[float]):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.frequency = 1
+
+
+class Cache:
+    """Thread-safe in-process cache with an optional shared L2 backend.
+
+    Entry sizes are measured as their pickled length, which is also what gets
+    written to L2.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: EvictionPolicy = EvictionPolicy.LRU,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        l2: Optional[L2Backend] = None
+    ):
+        self.name = name
+        self.policy = EvictionPolicy(policy)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.l2 = l2
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # LFU bookkeeping: frequency -> keys in least-recently-used order.
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._min_frequency = 0
+        # TTL bookkeeping: (expires_at, seq, key, entry), pruned lazily.
+        self._expiry_heap: List[tuple] = []
+        self._expiry_seq = itertools.count()
+        self._lock = threading.RLock()
+
+        self.bytes = 0
+        self.hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self.hits += 1
+                    self._touch(key, entry)
+                    return entry.value
+
+        if self.l2 is not None:
+            found = self._l2_call(self.l2.get, self.name, key)
+            if found is not None:
+                payload, remaining = found
+                value = pickle.loads(payload)
+                with self._lock:
+                    self.l2_hits += 1
+                    # Keep the L2 expiry rather than restarting the TTL.
+                    self._store(key, value, len(payload), remaining)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            stored = self._store(key, value, len(payload), ttl)
+        if self.l2 is not None:
+            if stored:
+                self._l2_call(self.l2.set, self.name, key, payload, ttl)
+            else:
+                # Too big to cache: drop the old value rather than keep serving it.
+                self._l2_call(self.l2.delete, self.name, key)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.l2 is not None:
+            self._l2_call(self.l2.delete, self.name, key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._min_frequency = 0
+            self._expiry_heap.clear()
+            self.bytes = 0
+        if self.l2 is not None:
+            self._l2_call(self.l2.clear, self.name)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return the cached value or store ``loader()``; ``None`` is never cached."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.l2_hits + self.misses
+            return {
+                "policy": self.policy.value,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "l2_hits": self.l2_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.l2_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "l2": self.l2.name if self.l2 is not None else None
+            }
+
+    def _l2_call(self, method, *args):
+        try:
+            return method(*args)
+        except (PyMongoError, sqlite3.Error):
+            logger.exception("L2 cache %s failed for cache %s", method.__name__, self.name)
+            return None
+
+    def _store(self, key: str, value: Any, size: int, ttl: Optional[float]) -> bool:
+        """Store ``value`` in L1; returns ``False`` when it is too big to keep."""
+        if key in self._entries:
+            self._remove(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        self._make_room(size)
+        expires_at = time.monotonic() + ttl if ttl else None
+        entry = _Entry(value, size, expires_at)
+        self._entries[key] = entry
+        self.bytes += size
+        if self.policy == EvictionPolicy.LFU:
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._min_frequency = 1
+        elif self.policy == EvictionPolicy.TTL:
+            if len(self._expiry_heap) > 2 * len(self._entries):
+                self._expiry_heap = [item for item in self._expiry_heap if self._entries.get(item[2]) is item[3]]
+                heapq.heapify(self._expiry_heap)
+            heapq.heappush(
+                self._expiry_heap,
+                (expires_at if expires_at is not None else float("inf"), next(self._expiry_seq), key, entry)
+            )
+        return True
+
+    def _touch(self, key: str, entry: _Entry) -> None:
+        if self.policy == EvictionPolicy.LRU:
+            self._entries.move_to_end(key)
+        elif self.policy == EvictionPolicy.LFU:
+            bucket = self._buckets[entry.frequency]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[entry.frequency]
+                if self._min_frequency == entry.frequency:
+                    self._min_frequency += 1
+            entry.frequency += 1
+            self._buckets.setdefault(entry.frequency, OrderedDict())[key] = None
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if self.policy == EvictionPolicy.LFU:
+            bucket = self._buckets[entry.frequency]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[entry.frequency]
+
+    def _victim(self) -> str:
+        if self.policy == EvictionPolicy.LFU:
+            if self._min_frequency not in self._buckets:
+                self._min_frequency = min(self._buckets)
+            return next(iter(self._buckets[self._min_frequency]))
+        if self.policy == EvictionPolicy.TTL:
+            # Skip heap items for keys since removed or overwritten.
+            while self._entries.get(self._expiry_heap[0][2]) is not self._expiry_heap[0][3]:
+                heapq.heappop(self._expiry_heap)
+            return self._expiry_heap[0][2]
+        return next(iter(self._entries))
+
+    def _make_room(self, size: int) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) >= self.max_entries)
+            or (self.max_bytes is not None and self.bytes + size > self.max_bytes)
+        ):
+            self._remove(self._victim())
+            self.evictions += 1
+
+
+class VersionStamp:
+    """Shared version counter for data cached on every replica.
+
+    Writers call ``bump()`` after changing the data; readers call
+    ``current()``, which re-reads the counter from ``cache_versions`` at most
+    once every ``check_interval`` seconds, and key their cache entries by it.
+    """
+
+    COLLECTION = "cache_versions"
+
+    def __init__(self, name: str, check_interval: float):
+        self.name = name
+        self.check_interval = check_interval
+        self._version = 0
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._version
+        doc = get_collection(self.COLLECTION).find_one({"_id": self.name})
+        with self._lock:
+            self._version = doc["version"] if doc else 0
+            self._checked_at = now
+            return self._version
+
+    def bump(self) -> int:
+        doc = get_collection(self.COLLECTION).find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self._version = doc["version"]
+            self._checked_at = time.monotonic()
+            return self._version
+
+    def expire(self) -> None:
+        """Force the next ``current()`` to re-read the counter."""
+        with self._lock:
+            self._checked_at = None
+
+
+_caches: Dict[str, Cache] = {}
+_caches_lock = threading.Lock()
+_default_l2: Optional[L2Backend] = None
+
+
+def default_l2_backend() -> Optional[L2Backend]:
+    global _default_l2
+    if _default_l2 is None:
+        if settings.CACHE_L2_BACKEND == "mongo":
+            _default_l2 = MongoCacheBackend()
+        elif settings.CACHE_L2_BACKEND == "sqlite":
+            _default_l2 = SQLiteCacheBackend(settings.CACHE_L2_SQLITE_PATH)
+    return _default_l2
+
+
+def get_cache(name: str, l2: bool = False, **options) -> Cache:
+    """Return the named cache, creating it with ``options`` on first use.
+
+    ``l2=True`` attaches the backend selected by ``CACHE_L2_BACKEND``, if any.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = Cache(name, l2=default_l2_backend() if l2 else None, **options)
+            _caches[name] = cache
+        return cache
+
+
+def _default_key(func: Callable, args: tuple, kwargs: dict) -> str:
+    parts = [repr(arg) for arg in args]
+    parts += [f"{name}={value!r}" for name, value in sorted(kwargs.items())]
+    return f"{func.__qualname__}({', '.join(parts)})"
+
+
+def cached(cache, key: Optional[Callable[..., str]] = None, ttl: Optional[float] = None):
+    """Memoize a sync or async function in ``cache`` (a Cache or a cache name)."""
+
+    def decorator(func):
+        target = cache if isinstance(cache, Cache) else get_cache(cache)
+
+        def make_key(args, kwargs):
+            return key(*args, **kwargs) if key else _default_key(func, args, kwargs)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cache_key = make_key(args, kwargs)
+                value = target.get(cache_key, _MISSING)
+                if value is _MISSING:
+                    value = await func(*args, **kwargs)
+                    if value is not None:
+                        target.set(cache_key, value, ttl)
+                return value
+
+            async_wrapper.cache = target
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return target.get_or_load(make_key(args, kwargs), lambda: func(*args, **kwargs), ttl)
+
+        wrapper.cache = target
+        return wrapper
+
+    return decorator
+
+
+def cache_metrics() -> dict:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+register_collector("caches", cache_metrics)
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from bson.timestamp import Timestamp
+
+from common.config import settings
+from common.database import get_collection
+
+TOMBSTONES_COLLECTION = "catalog_tombstones"
+
+# Every catalog write stamps this field with a server-assigned BSON
+# timestamp, so "changed since" is a single range query.
+VERSION_FIELD = "change_version"
+
+VERSION_STAMP = {VERSION_FIELD: {"$type": "timestamp"}, "updated_at": True}
+
+
+def versioned(update: dict) -> dict:
+    """Add the change-version stamp to an update document."""
+    return {**update, "$currentDate": {**update.get("$currentDate", {}), **VERSION_STAMP}}
+
+
+def record_tombstone(entity: str, entity_id: str) -> None:
+    """Remember a deleted product or category so mirrors can drop it."""
+    get_collection(TOMBSTONES_COLLECTION).update_one(
+        {"_id": ObjectId()},
+        versioned({"$setOnInsert": {"entity": entity, "entity_id": entity_id, "deleted_at": datetime.utcnow()}}),
+        upsert=True
+    )
+
+
+def ensure_catalog_versions() -> None:
+    """Index the change versions and stamp documents written before they existed."""
+    for name in ("products", "categories", TOMBSTONES_COLLECTION):
+        get_collection(name).create_index([(VERSION_FIELD, 1), ("_id", 1)], name="change_version")
+    get_collection(TOMBSTONES_COLLECTION).create_index(
+        "deleted_at",
+        name="tombstones_ttl",
+        expireAfterSeconds=settings.CATALOG_TOMBSTONE_TTL_DAYS * 86400
+    )
+    for name in ("products", "categories"):
+        get_collection(name).update_many({VERSION_FIELD: {"$exists": False}}, versioned({}))
+
+
+# Change kinds in feed order; documents sharing a version are ordered by
+# kind, then _id.
+CHANGE_SOURCES = (("product", "products"), ("category", "categories"), ("deleted", TOMBSTONES_COLLECTION))
+
+
+# A token is the position reached, plus when the mirror's copy was last
+# complete: tombstones are kept CATALOG_TOMBSTONE_TTL_DAYS from then, not
+# from the version of whichever document a page happened to end on.
+ChangeToken = Tuple[Timestamp, int, Optional[ObjectId], int]
+
+
+def encode_token(version: Timestamp, kind: Optional[int] = None, last_id: Optional[ObjectId] = None, synced: int = 0) -> str:
+    token = f"{version.time}.{version.inc}"
+    if kind is not None:
+        token += f".{kind}.{last_id}.{synced}"
+    return token
+
+
+def decode_token(token: str) -> Optional[ChangeToken]:
+    """``(version, kind, last_id, synced)``.
+
+    A bare version means everything at it was sent, and the mirror was
+    complete as of that version; a mid-pass token carries ``synced``, the
+    time the pass started from.
+    """
+    parts = token.split(".")
+    try:
+        version = Timestamp(int(parts[0]), int(parts[1]))
+        if len(parts) == 2:
+            return version, len(CHANGE_SOURCES), None, version.time
+        if len(parts) == 5 and 0 <= int(parts[2]) < len(CHANGE_SOURCES):
+            return version, int(parts[2]), ObjectId(parts[3]), int(parts[4])
+    except (ValueError, TypeError, OverflowError, InvalidId, IndexError):
+        pass
+    return None
+
+
+def settled_version() -> Timestamp:
+    """Newest version a change feed may hand out.
+
+    Writes a few seconds older than now have committed, so nothing can still
+    appear below this point and be skipped by a client that synced past it.
+    """
+    settled = datetime.utcnow() - timedelta(seconds=settings.CATALOG_CHANGES_SETTLE_SECONDS)
+    return Timestamp(settled, 0)
+
+
+def token_expired(token: ChangeToken) -> bool:
+    """True if tombstones the mirror still needs may already have been purged."""
+    retention = timedelta(days=settings.CATALOG_TOMBSTONE_TTL_DAYS)
+    return datetime.utcfromtimestamp(token[3]) < datetime.utcnow() - retention
+
+
+def read_changes(since: Optional[ChangeToken], limit: int) -> Tuple[list, str, bool]:
+    """Up to ``limit`` ``(kind, document)`` changes after ``since``, oldest first.
+
+    Returns the page, the token to pass next time and whether more changes
+    are already waiting. Paging is by ``(version, kind, _id)``, so a batch
+    of documents stamped with the same version can span pages.
+    """
+    upper = settled_version()
+    # A full sync starts from nothing, so its copy is complete as of now.
+    version, after_kind, after_id, synced = since or (Timestamp(0, 0), len(CHANGE_SOURCES), None, upper.time)
+
+    changes = []
+    for kind, (name, collection_name) in enumerate(CHANGE_SOURCES):
+        if kind < after_kind:
+            lower = {VERSION_FIELD: {"$gt": version, "$lte": upper}}
+        elif kind == after_kind:
+            lower = {"$or": [
+                {VERSION_FIELD: {"$gt": version, "$lte": upper}},
+                {VERSION_FIELD: version, "_id": {"$gt": after_id}}
+            ]}
+        else:
+            lower = {VERSION_FIELD: {"$gte": version, "$lte": upper}}
+        cursor = get_collection(collection_name).find(lower).sort([(VERSION_FIELD, 1), ("_id", 1)]).limit(limit + 1)
+        changes.extend((doc[VERSION_FIELD], kind, doc["_id"], name, doc) for doc in cursor)
+    changes.sort(key=lambda change: change[:3])
+
+    has_more = len(changes) > limit
+    page = changes[:limit]
+    if has_more:
+        last_version, last_kind, last_id = page[-1][:3]
+        next_token = encode_token(last_version, last_kind, last_id, synced)
+    else:
+        next_token = encode_token(max(upper, version))
+    return [(name, doc) for _, _, _, name, doc in page], next_token, has_more
@@ -0,0 +1,106 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from common.background import acquire_lease, release_lease
+from common.database import get_collection
+
+CATEGORY_STATS_COLLECTION = "category_stats"
+# Kept apart from the counts, which $out replaces on every rebuild.
+CATEGORY_STATS_STATE_COLLECTION = "category_stats_state"
+SEED_JOB = "category_stats_seed"
+SEED_LEASE_SECONDS = 300
+
+
+def _count_deltas(changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> Dict[str, dict]:
+    deltas = defaultdict(lambda: {"product_count": 0, "in_stock_count": 0})
+    for before, after in changes:
+        for product, sign in ((before, -1), (after, 1)):
+            if not product or not product.get("category_id"):
+                continue
+            counts = deltas[product["category_id"]]
+            counts["product_count"] += sign
+            if product.get("stock", 0) > 0:
+                counts["in_stock_count"] += sign
+    return {
+        category_id: {field: value for field, value in counts.items() if value}
+        for category_id, counts in deltas.items()
+        if any(counts.values())
+    }
+
+
+def apply_product_changes(changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Update per-category counts for ``(before, after)`` product states.
+
+    Only ``category_id`` and ``stock`` are read from each state; ``None``
+    stands for "did not exist", so creates pass ``(None, product)`` and
+    deletes pass ``(product, None)``.
+    """
+    deltas = _count_deltas(changes)
+    if not deltas:
+        return
+    get_collection(CATEGORY_STATS_COLLECTION).bulk_write(
+        [
+            UpdateOne({"_id": category_id}, {"$inc": counts}, upsert=True)
+            for category_id, counts in deltas.items()
+        ],
+        ordered=False
+    )
+
+
+def apply_product_change(before: Optional[dict], after: Optional[dict]) -> None:
+    apply_product_changes([(before, after)])
+
+
+def stock_change(category_id: Optional[str], previous_stock: int, new_stock: int) -> tuple:
+    return (
+        {"category_id": category_id, "stock": previous_stock},
+        {"category_id": category_id, "stock": new_stock}
+    )
+
+
+def get_category_stats() -> Dict[str, dict]:
+    return {
+        doc["_id"]: {
+            "product_count": doc.get("product_count", 0),
+            "in_stock_count": doc.get("in_stock_count", 0)
+        }
+        for doc in get_collection(CATEGORY_STATS_COLLECTION).find()
+    }
+
+
+def rebuild_category_stats() -> None:
+    """Recompute every category's counts from ``products`` in one aggregation."""
+    get_collection("products").aggregate([
+        {"$match": {"category_id": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": "$category_id",
+            "product_count": {"$sum": 1},
+            "in_stock_count": {"$sum": {"$cond": [{"$gt": ["$stock", 0]}, 1, 0]}}
+        }},
+        {"$out": CATEGORY_STATS_COLLECTION}
+    ])
+    get_collection(CATEGORY_STATS_STATE_COLLECTION).update_one(
+        {"_id": "seeded"},
+        {"$set": {"rebuilt_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def ensure_category_stats() -> None:
+    """Seed the counts from ``products`` once, before any delta lands on them.
+
+    The incremental ``$inc`` updates only move counts that already match the
+    catalog, so a deployment without the seeded marker is rebuilt first.
+    """
+    if get_collection(CATEGORY_STATS_STATE_COLLECTION).find_one({"_id": "seeded"}, {"_id": 1}):
+        return
+    # Another replica holding the lease is seeding already.
+    if not acquire_lease(SEED_JOB, SEED_LEASE_SECONDS):
+        return
+    try:
+        rebuild_category_stats()
+    finally:
+        release_lease(SEED_JOB)
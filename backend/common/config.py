@@ -16,5 +16,73 @@ class Settings:
     
     CORS_ORIGINS: list = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
 
+    # auto | changestream | poll | off
+    EVENTS_MODE: str = os.getenv("EVENTS_MODE", "auto").lower()
+    EVENTS_POLL_INTERVAL_MS: int = int(os.getenv("EVENTS_POLL_INTERVAL_MS", "500"))
+    EVENTS_RETENTION_HOURS: int = int(os.getenv("EVENTS_RETENTION_HOURS", "24"))
+
+    # "" (in-process only) | mongo | sqlite
+    CACHE_L2_BACKEND: str = os.getenv("CACHE_L2_BACKEND", "").lower()
+    CACHE_L2_SQLITE_PATH: str = os.getenv("CACHE_L2_SQLITE_PATH", "/tmp/retail-cache.sqlite3")
+    PRODUCT_CACHE_TTL_SECONDS: int = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "60"))
+    PRODUCT_CACHE_MAX_BYTES: int = int(os.getenv("PRODUCT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    CATEGORY_VERSION_CHECK_SECONDS: float = float(os.getenv("CATEGORY_VERSION_CHECK_SECONDS", "5"))
+    CATEGORY_COUNTS_TTL_SECONDS: float = float(os.getenv("CATEGORY_COUNTS_TTL_SECONDS", "10"))
+
+    INVENTORY_BULK_MAX_ROWS: int = int(os.getenv("INVENTORY_BULK_MAX_ROWS", "5000"))
+    STOCK_HISTORY_RETENTION_DAYS: int = int(os.getenv("STOCK_HISTORY_RETENTION_DAYS", "90"))
+    STOCK_HISTORY_ROLLUP_INTERVAL_SECONDS: int = int(os.getenv("STOCK_HISTORY_ROLLUP_INTERVAL_SECONDS", "3600"))
+    LOW_STOCK_THRESHOLD: int = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+    ALERT_RULES_CHECK_SECONDS: float = float(os.getenv("ALERT_RULES_CHECK_SECONDS", "10"))
+
+    RESERVATION_TTL_SECONDS: int = int(os.getenv("RESERVATION_TTL_SECONDS", "600"))
+    RESERVATION_MAX_TTL_SECONDS: int = int(os.getenv("RESERVATION_MAX_TTL_SECONDS", "1800"))
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("RESERVATION_SWEEP_INTERVAL_SECONDS", "15"))
+
+    STOCK_SHARDS_MAX: int = int(os.getenv("STOCK_SHARDS_MAX", "64"))
+    STOCK_SHARD_RECONCILE_SECONDS: float = float(os.getenv("STOCK_SHARD_RECONCILE_SECONDS", "1"))
+
+    IDEMPOTENCY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+    ORDER_INTAKE_MODE: str = os.getenv("ORDER_INTAKE_MODE", "sync")
+    ORDER_QUEUE_WORKERS: int = int(os.getenv("ORDER_QUEUE_WORKERS", "2"))
+    ORDER_QUEUE_BATCH_SIZE: int = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", "20"))
+    ORDER_QUEUE_MAX_DEPTH: int = int(os.getenv("ORDER_QUEUE_MAX_DEPTH", "10000"))
+    ORDER_QUEUE_POLL_MS: int = int(os.getenv("ORDER_QUEUE_POLL_MS", "200"))
+    ORDER_QUEUE_LOCK_SECONDS: float = float(os.getenv("ORDER_QUEUE_LOCK_SECONDS", "60"))
+    ORDER_QUEUE_MAX_ATTEMPTS: int = int(os.getenv("ORDER_QUEUE_MAX_ATTEMPTS", "3"))
+
+    ORDER_BULK_STATUS_MAX: int = int(os.getenv("ORDER_BULK_STATUS_MAX", "1000"))
+
+    ORDER_ARCHIVE_AFTER_DAYS: int = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "180"))
+    ORDER_ARCHIVE_BATCH_SIZE: int = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "500"))
+    ORDER_ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("ORDER_ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+    ORDER_SNAPSHOT_DIR: str = os.getenv("ORDER_SNAPSHOT_DIR", "data/orders_snapshot")
+    ORDER_SNAPSHOT_INTERVAL_SECONDS: float = float(os.getenv("ORDER_SNAPSHOT_INTERVAL_SECONDS", "3600"))
+
+    RELATED_PRODUCTS_TOP_K: int = int(os.getenv("RELATED_PRODUCTS_TOP_K", "20"))
+    RELATED_PRODUCTS_MIN_COUNT: int = int(os.getenv("RELATED_PRODUCTS_MIN_COUNT", "2"))
+    RELATED_PRODUCTS_MAX_BASKET: int = int(os.getenv("RELATED_PRODUCTS_MAX_BASKET", "50"))
+    RELATED_PRODUCTS_INTERVAL_SECONDS: float = float(os.getenv("RELATED_PRODUCTS_INTERVAL_SECONDS", "86400"))
+    RELATED_PRODUCTS_RELOAD_SECONDS: float = float(os.getenv("RELATED_PRODUCTS_RELOAD_SECONDS", "300"))
+
+    SIMILAR_PRODUCTS_DIMENSIONS: int = int(os.getenv("SIMILAR_PRODUCTS_DIMENSIONS", "1024"))
+    SIMILAR_PRODUCTS_REBUILD_SECONDS: float = float(os.getenv("SIMILAR_PRODUCTS_REBUILD_SECONDS", "3600"))
+
+    POPULARITY_FLUSH_SECONDS: float = float(os.getenv("POPULARITY_FLUSH_SECONDS", "10"))
+    POPULARITY_HALF_LIFE_HOURS: float = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "72"))
+    POPULARITY_CART_WEIGHT: float = float(os.getenv("POPULARITY_CART_WEIGHT", "5"))
+    POPULARITY_DECAY_INTERVAL_SECONDS: float = float(os.getenv("POPULARITY_DECAY_INTERVAL_SECONDS", "3600"))
+
+    CATALOG_TOMBSTONE_TTL_DAYS: int = int(os.getenv("CATALOG_TOMBSTONE_TTL_DAYS", "30"))
+    CATALOG_CHANGES_SETTLE_SECONDS: int = int(os.getenv("CATALOG_CHANGES_SETTLE_SECONDS", "2"))
+
+    SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    SSE_QUEUE_SIZE: int = int(os.getenv("SSE_QUEUE_SIZE", "1000"))
+    SSE_REPLAY_LIMIT: int = int(os.getenv("SSE_REPLAY_LIMIT", "1000"))
+
 
 settings = Settings()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import Optional
 
@@ -49,7 +50,8 @@ def setup_exception_handlers(app: FastAPI) -> None:
             404: "NOT_FOUND",
             409: "CONFLICT",
             422: "VALIDATION_ERROR",
-            500: "INTERNAL_ERROR"
+            500: "INTERNAL_ERROR",
+            503: "SERVICE_UNAVAILABLE"
         }
         return JSONResponse(
             status_code=exc.status_code,
@@ -57,12 +59,13 @@ def setup_exception_handlers(app: FastAPI) -> None:
                 "status_code": exc.status_code,
                 "error_code": error_codes.get(exc.status_code, "ERROR"),
                 "message": exc.detail
-            }
+            },
+            headers=exc.headers
         )
 
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError):
-        errors = exc.errors()
+        errors = jsonable_encoder(exc.errors())
         return JSONResponse(
             status_code=422,
             content={
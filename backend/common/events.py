@@ -0,0 +1,240 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo.errors import PyMongoError
+
+from common.config import settings
+from common.database import get_collection, get_database
+
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = "events"
+
+# Identifies this worker process so it can skip its own events when they come
+# back through the change stream or the outbox poller.
+PROCESS_ID = uuid.uuid4().hex
+
+# How far back the outbox poller re-reads, to catch inserts from other
+# processes whose ObjectIds sort just before the last one we saw.
+POLL_LOOKBACK = timedelta(seconds=2)
+
+
+class EventType(str, Enum):
+    PRODUCT_CREATED = "product.created"
+    PRODUCT_UPDATED = "product.updated"
+    PRODUCT_DELETED = "product.deleted"
+    STOCK_CHANGED = "stock.changed"
+    CATEGORY_CREATED = "category.created"
+    CATEGORY_UPDATED = "category.updated"
+    CATEGORY_RENAMED = "category.renamed"
+    CATEGORY_DELETED = "category.deleted"
+    ORDER_CREATED = "order.created"
+    ORDER_STATUS_CHANGED = "order.status_changed"
+
+
+class Event(BaseModel):
+    id: str
+    type: EventType
+    entity_id: str
+    data: dict = {}
+    origin: str
+    created_at: datetime
+
+
+EventHandler = Callable[[Event], None]
+
+_subscribers: Dict[Optional[EventType], List[EventHandler]] = {}
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(event_types: Union[EventType, Iterable[EventType], None], handler: EventHandler) -> None:
+    """Register a handler; ``None`` subscribes to every event type."""
+    if event_types is None or isinstance(event_types, EventType):
+        event_types = [event_types]
+    with _subscribers_lock:
+        for event_type in event_types:
+            _subscribers.setdefault(event_type, []).append(handler)
+
+
+def unsubscribe(handler: EventHandler) -> None:
+    with _subscribers_lock:
+        for handlers in _subscribers.values():
+            if handler in handlers:
+                handlers.remove(handler)
+
+
+def dispatch(event: Event) -> None:
+    with _subscribers_lock:
+        handlers = list(_subscribers.get(event.type, [])) + list(_subscribers.get(None, []))
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception:
+            logger.exception("Event handler %r failed for %s", handler, event.type.value)
+
+
+def event_from_doc(doc: dict) -> Event:
+    return Event(
+        id=str(doc["_id"]),
+        type=EventType(doc["type"]),
+        entity_id=doc["entity_id"],
+        data=doc.get("data") or {},
+        origin=doc["origin"],
+        created_at=doc["created_at"]
+    )
+
+
+def _new_event_doc(event_type: EventType, entity_id: str, data: Optional[dict]) -> dict:
+    return {
+        "_id": ObjectId(),
+        "type": event_type.value,
+        "entity_id": entity_id,
+        "data": data or {},
+        "origin": PROCESS_ID,
+        "created_at": datetime.utcnow()
+    }
+
+
+def publish_many(events: List[tuple]) -> List[Event]:
+    """Publish ``(event_type, entity_id, data)`` tuples with a single outbox write.
+
+    Local subscribers are notified immediately; other replicas pick the events
+    up from the outbox. A failed outbox write is logged, not raised, so the
+    caller's own write is never rolled back because of it.
+    """
+    docs = [_new_event_doc(event_type, entity_id, data) for event_type, entity_id, data in events]
+    if not docs:
+        return []
+
+    if settings.EVENTS_MODE != "off":
+        try:
+            get_collection(EVENTS_COLLECTION).insert_many(docs, ordered=False)
+        except PyMongoError:
+            logger.exception("Failed to write %d event(s) to the outbox", len(docs))
+
+    published = [event_from_doc(doc) for doc in docs]
+    for event in published:
+        dispatch(event)
+    return published
+
+
+def publish(event_type: EventType, entity_id: str, data: Optional[dict] = None) -> Event:
+    return publish_many([(event_type, entity_id, data)])[0]
+
+
+def supports_change_streams() -> bool:
+    try:
+        hello = get_database().client.admin.command("hello")
+    except PyMongoError:
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+class EventListener:
+    """Feeds events written by other processes to the local subscribers.
+
+    Tails the outbox with a change stream when the deployment supports it and
+    falls back to polling the outbox on standalone servers.
+    """
+
+    def __init__(self, mode: str = "auto"):
+        if mode == "auto":
+            mode = "changestream" if supports_change_streams() else "poll"
+        self.mode = mode
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._resume_token = None
+        self._seen: "OrderedDict[ObjectId, None]" = OrderedDict()
+
+    def start(self) -> None:
+        collection = get_collection(EVENTS_COLLECTION)
+        collection.create_index(
+            "created_at",
+            expireAfterSeconds=settings.EVENTS_RETENTION_HOURS * 3600
+        )
+        target = self._run_change_stream if self.mode == "changestream" else self._run_poll
+        self._thread = threading.Thread(target=target, name="event-listener", daemon=True)
+        self._thread.start()
+        logger.info("Event listener started in %s mode", self.mode)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run_change_stream(self) -> None:
+        collection = get_collection(EVENTS_COLLECTION)
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "fullDocument.origin": {"$ne": PROCESS_ID}
+        }}]
+        while not self._stop.is_set():
+            try:
+                with collection.watch(
+                    pipeline,
+                    resume_after=self._resume_token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        self._resume_token = stream.resume_token
+                        if change is not None:
+                            dispatch(event_from_doc(change["fullDocument"]))
+            except PyMongoError:
+                logger.exception("Event change stream failed, retrying")
+                self._stop.wait(settings.EVENTS_POLL_INTERVAL_MS / 1000)
+
+    def _run_poll(self) -> None:
+        collection = get_collection(EVENTS_COLLECTION)
+        interval = settings.EVENTS_POLL_INTERVAL_MS / 1000
+        since = datetime.utcnow()
+        while not self._stop.wait(interval):
+            started = datetime.utcnow()
+            try:
+                cursor = collection.find({
+                    "_id": {"$gte": ObjectId.from_datetime(since - POLL_LOOKBACK)},
+                    "origin": {"$ne": PROCESS_ID}
+                }).sort("_id", 1)
+                for doc in cursor:
+                    if doc["_id"] in self._seen:
+                        continue
+                    self._seen[doc["_id"]] = None
+                    dispatch(event_from_doc(doc))
+            except PyMongoError:
+                logger.exception("Event outbox poll failed, retrying")
+                continue
+            since = started
+            self._forget_before(since - POLL_LOOKBACK)
+
+    def _forget_before(self, cutoff: datetime) -> None:
+        cutoff_id = ObjectId.from_datetime(cutoff)
+        while self._seen:
+            oldest = next(iter(self._seen))
+            if oldest >= cutoff_id:
+                break
+            self._seen.popitem(last=False)
+
+
+_listener: Optional[EventListener] = None
+
+
+def start_event_listener() -> None:
+    global _listener
+    if settings.EVENTS_MODE == "off" or _listener is not None:
+        return
+    _listener = EventListener(settings.EVENTS_MODE)
+    _listener.start()
+
+
+def stop_event_listener() -> None:
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
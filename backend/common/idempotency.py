@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# How often a duplicate re-checks the request it is waiting on.
+WAIT_POLL_SECONDS = 0.1
+
+_stats = {"executed": 0, "replayed": 0, "waited": 0, "mismatched": 0, "timed_out": 0}
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Hash of what the request asked for, to catch a key reused for another request."""
+    encoded = json.dumps(jsonable_encoder(parts), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def ensure_idempotency_indexes() -> None:
+    get_collection(IDEMPOTENCY_COLLECTION).create_index("expires_at", expireAfterSeconds=0)
+
+
+def _claim(record_id: str, fingerprint: str) -> Optional[dict]:
+    """Claim the key for this request; returns the existing record if someone else holds it."""
+    collection = get_collection(IDEMPOTENCY_COLLECTION)
+    now = datetime.utcnow()
+    claim = {
+        "fingerprint": fingerprint,
+        "status": "in_progress",
+        "locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        "expires_at": now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+        "created_at": now
+    }
+    while True:
+        try:
+            collection.insert_one({"_id": record_id, **claim})
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # Take over a key whose owner died mid-request, or one past its TTL
+        # that the TTL monitor hasn't removed yet.
+        taken = collection.find_one_and_update(
+            {"_id": record_id, "$or": [
+                {"status": "in_progress", "locked_until": {"$lte": now}, "fingerprint": fingerprint},
+                {"expires_at": {"$lte": now}}
+            ]},
+            {"$set": claim, "$unset": {"status_code": "", "body": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+        if taken:
+            return None
+        existing = collection.find_one({"_id": record_id})
+        if existing:
+            return existing
+        # The holder failed and released the key in between; claim it again.
+
+
+async def run_idempotent(
+    key: Optional[str],
+    user_id: str,
+    fingerprint: str,
+    handler: Callable[[], Any],
+    status_code: int = status.HTTP_200_OK
+) -> Any:
+    """Run ``handler`` at most once per ``(user_id, key)``.
+
+    A repeated key gets the first response back without running the handler
+    again; a duplicate that arrives while the first is still running waits
+    for it. Failed requests release the key so the client can retry.
+    """
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters"
+        )
+
+    collection = get_collection(IDEMPOTENCY_COLLECTION)
+    record_id = f"{user_id}:{key}"
+    waited = 0.0
+    while True:
+        existing = _claim(record_id, fingerprint)
+        if existing is None:
+            break
+        if existing["fingerprint"] != fingerprint:
+            _stats["mismatched"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        if existing["status"] == "completed":
+            _stats["replayed"] += 1
+            return JSONResponse(
+                status_code=existing["status_code"],
+                content=existing["body"],
+                headers={REPLAYED_HEADER: "true"}
+            )
+        if waited >= settings.IDEMPOTENCY_WAIT_SECONDS:
+            _stats["timed_out"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress"
+            )
+        if not waited:
+            _stats["waited"] += 1
+        await asyncio.sleep(WAIT_POLL_SECONDS)
+        waited += WAIT_POLL_SECONDS
+
+    try:
+        result = handler()
+    except BaseException:
+        collection.delete_one({"_id": record_id, "status": "in_progress"})
+        raise
+
+    _stats["executed"] += 1
+    collection.update_one(
+        {"_id": record_id},
+        {
+            "$set": {
+                "status": "completed",
+                "status_code": status_code,
+                "body": jsonable_encoder(result),
+                "completed_at": datetime.utcnow()
+            },
+            "$unset": {"locked_until": ""}
+        }
+    )
+    return result
+
+
+register_collector("idempotency", lambda: dict(_stats))
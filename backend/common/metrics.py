@@ -0,0 +1,17 @@
+import threading
+from typing import Callable, Dict
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+_lock = threading.Lock()
+
+
+def register_collector(name: str, collector: Callable[[], dict]) -> None:
+    """Expose ``collector()`` under ``name`` on the service's /metrics endpoint."""
+    with _lock:
+        _collectors[name] = collector
+
+
+def collect_metrics() -> dict:
+    with _lock:
+        collectors = dict(_collectors)
+    return {name: collector() for name, collector in collectors.items()}
@@ -0,0 +1,36 @@
+import base64
+import binascii
+from typing import List
+
+from bson import json_util
+from fastapi import HTTPException, status
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque keyset cursor for the sort key values of the last returned row."""
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+
+def after_key(fields: List[str], values: list, descending: bool = False) -> dict:
+    """Filter selecting rows strictly after ``values`` in ``fields`` sort order."""
+    op = "$lt" if descending else "$gt"
+    clauses = []
+    for i, field in enumerate(fields):
+        clause = {fields[j]: values[j] for j in range(i)}
+        clause[field] = {op: values[i]}
+        clauses.append(clause)
+    return {"$or": clauses} if len(clauses) > 1 else clauses[0]
@@ -0,0 +1,149 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Scores below this after decay are reset to 0 and no longer decayed.
+POPULARITY_FLOOR = 0.01
+
+
+def _decayed(now: datetime) -> dict:
+    """``popularity`` decayed from ``popularity_at`` to ``now``, as an aggregation expression."""
+    return {"$multiply": [
+        {"$ifNull": ["$popularity", 0]},
+        {"$pow": [0.5, {"$divide": [
+            {"$subtract": [now, {"$ifNull": ["$popularity_at", now]}]},
+            settings.POPULARITY_HALF_LIFE_HOURS * 3600 * 1000
+        ]}]}
+    ]}
+
+
+class PopularityCounters:
+    """Per-process product view and add-to-cart counts, written out in batches.
+
+    Recording is an in-memory increment. ``flush`` folds everything counted
+    since the last flush into one update per product, so the write rate is
+    set by the flush interval and the number of distinct products touched,
+    not by traffic.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(lambda: {"views": 0, "cart_adds": 0})
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.flushes = 0
+        self.writes = 0
+        self.failures = 0
+
+    def record(self, product_id: str, views: int = 0, cart_adds: int = 0) -> None:
+        with self._lock:
+            counts = self._pending[product_id]
+            counts["views"] += views
+            counts["cart_adds"] += cart_adds
+            self.recorded += 1
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: {"views": 0, "cart_adds": 0})
+        if not pending:
+            return 0
+
+        now = datetime.utcnow()
+        writes = []
+        written_ids = []
+        for product_id, counts in pending.items():
+            try:
+                object_id = ObjectId(product_id)
+            except InvalidId:
+                continue
+            written_ids.append(product_id)
+            weight = counts["views"] + counts["cart_adds"] * settings.POPULARITY_CART_WEIGHT
+            # Decay the stored score to now before adding, in the same update.
+            writes.append(UpdateOne({"_id": object_id}, [{"$set": {
+                "popularity": {"$add": [_decayed(now), weight]},
+                "popularity_at": now,
+                "view_count": {"$add": [{"$ifNull": ["$view_count", 0]}, counts["views"]]},
+                "cart_add_count": {"$add": [{"$ifNull": ["$cart_add_count", 0]}, counts["cart_adds"]]}
+            }}]))
+        try:
+            if writes:
+                get_collection("products").bulk_write(writes, ordered=False)
+        except BulkWriteError as exc:
+            # Unordered: everything but the reported errors was applied.
+            failed = [written_ids[error["index"]] for error in exc.details.get("writeErrors", [])]
+            self.failures += 1
+            logger.error("Failed to flush popularity for %d products; keeping them for the next flush", len(failed))
+            self._restore({product_id: pending[product_id] for product_id in failed})
+            self.flushes += 1
+            self.writes += len(writes) - len(failed)
+            return len(writes) - len(failed)
+        except PyMongoError:
+            self.failures += 1
+            logger.exception("Failed to flush popularity counters; keeping them for the next flush")
+            self._restore(pending)
+            return 0
+        self.flushes += 1
+        self.writes += len(writes)
+        return len(writes)
+
+    def _restore(self, counts_by_product: Dict[str, Dict[str, int]]) -> None:
+        with self._lock:
+            for product_id, counts in counts_by_product.items():
+                self._pending[product_id]["views"] += counts["views"]
+                self._pending[product_id]["cart_adds"] += counts["cart_adds"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "recorded": self.recorded,
+            "pending_products": pending,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "failures": self.failures
+        }
+
+
+popularity_counters = PopularityCounters()
+
+
+def record_view(product_id: str) -> None:
+    popularity_counters.record(product_id, views=1)
+
+
+def record_cart_add(product_id: str) -> None:
+    popularity_counters.record(product_id, cart_adds=1)
+
+
+def decay_popularity() -> int:
+    """Bring every stored score down to its value now, so sorting by it ranks fairly.
+
+    Products are only written by ``flush`` when they get new activity; this
+    catches up the rest. Scores that decay below ``POPULARITY_FLOOR`` drop
+    to 0 and are skipped from then on.
+    """
+    now = datetime.utcnow()
+    decayed = _decayed(now)
+    result = get_collection("products").update_many(
+        {"popularity": {"$gt": 0}},
+        [{"$set": {
+            "popularity": {"$cond": [{"$lt": [decayed, POPULARITY_FLOOR]}, 0, decayed]},
+            "popularity_at": now
+        }}]
+    )
+    return result.modified_count
+
+
+register_collector("popularity", popularity_counters.stats)
@@ -0,0 +1,171 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+
+from common.database import get_collection
+
+RESERVATIONS_COLLECTION = "stock_reservations"
+
+
+def available_filter(quantity: int) -> dict:
+    """Match products whose unreserved stock covers ``quantity``."""
+    return {"$expr": {"$gte": [
+        {"$subtract": [{"$ifNull": ["$stock", 0]}, {"$ifNull": ["$reserved", 0]}]},
+        quantity
+    ]}}
+
+
+def available_stock(product: dict) -> int:
+    return max(product.get("stock", 0) - product.get("reserved", 0), 0)
+
+
+def release_quantities(quantities: Dict[str, int]) -> None:
+    """Hand held quantities back, one bulk write for all products."""
+    requests = [
+        UpdateOne({"_id": ObjectId(product_id)}, {"$inc": {"reserved": -quantity}})
+        for product_id, quantity in quantities.items()
+        if quantity > 0
+    ]
+    if requests:
+        get_collection("products").bulk_write(requests, ordered=False)
+
+
+def create_reservation(user_id: str, items: Iterable[tuple], ttl_seconds: int) -> dict:
+    """Hold ``(product_id, quantity)`` pairs for ``ttl_seconds``.
+
+    Each product's hold is one conditional ``$inc`` on its ``reserved``
+    counter; if any product can't cover its quantity the holds taken so far
+    are handed back and nothing is reserved.
+    """
+    quantities = defaultdict(int)
+    for product_id, quantity in items:
+        quantities[product_id] += quantity
+
+    object_ids = {}
+    for product_id in quantities:
+        try:
+            object_ids[product_id] = ObjectId(product_id)
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid product ID: {product_id}"
+            )
+
+    products_collection = get_collection("products")
+    held = {}
+    try:
+        for product_id, quantity in quantities.items():
+            product = products_collection.find_one_and_update(
+                {"_id": object_ids[product_id], **available_filter(quantity)},
+                {"$inc": {"reserved": quantity}},
+                projection={"title": 1}
+            )
+            if product is None:
+                if products_collection.count_documents({"_id": object_ids[product_id]}, limit=1):
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Insufficient stock for product: {product_id}"
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Product not found: {product_id}"
+                )
+            held[product_id] = quantity
+    except HTTPException:
+        release_quantities(held)
+        raise
+
+    now = datetime.utcnow()
+    reservation = {
+        "user_id": user_id,
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in held.items()],
+        "status": "active",
+        "expires_at": now + timedelta(seconds=ttl_seconds),
+        "created_at": now
+    }
+    reservation["_id"] = get_collection(RESERVATIONS_COLLECTION).insert_one(reservation).inserted_id
+    return reservation
+
+
+def _close_reservation(reservation_id: str, user_id: Optional[str], new_status: str) -> Optional[dict]:
+    try:
+        object_id = ObjectId(reservation_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid reservation ID format"
+        )
+    query = {"_id": object_id, "status": "active", "expires_at": {"$gt": datetime.utcnow()}}
+    if user_id is not None:
+        query["user_id"] = user_id
+    return get_collection(RESERVATIONS_COLLECTION).find_one_and_update(
+        query,
+        {"$set": {"status": new_status, "closed_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def claim_reservation(reservation_id: str, user_id: str) -> Dict[str, int]:
+    """Mark the user's active reservation consumed and return its held quantities.
+
+    The caller owns the quantities from here on: it turns them into stock
+    decrements, and must ``release_quantities`` whatever it doesn't use.
+    """
+    reservation = _close_reservation(reservation_id, user_id, "consumed")
+    if reservation is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Reservation not found or expired"
+        )
+    return {item["product_id"]: item["quantity"] for item in reservation["items"]}
+
+
+def cancel_reservation(reservation_id: str, user_id: Optional[str] = None) -> dict:
+    reservation = _close_reservation(reservation_id, user_id, "released")
+    if reservation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Reservation not found or no longer active"
+        )
+    release_quantities({item["product_id"]: item["quantity"] for item in reservation["items"]})
+    return reservation
+
+
+def sweep_expired_reservations() -> int:
+    """Expire every lapsed hold, then release expired holds not yet released.
+
+    Expiring only flips ``status``, so holds consumed or cancelled
+    concurrently are never released twice. A hold gets ``closed_at`` (and
+    so the closed-reservation TTL) only once its quantities are handed
+    back, so holds expired by a sweep that died before releasing them are
+    picked up by the next one.
+    """
+    reservations_collection = get_collection(RESERVATIONS_COLLECTION)
+    now = datetime.utcnow()
+    reservations_collection.update_many(
+        {"status": "active", "expires_at": {"$lte": now}},
+        {"$set": {"status": "expired", "expired_at": now}}
+    )
+
+    unreleased = list(reservations_collection.find(
+        {"status": "expired", "closed_at": {"$exists": False}},
+        {"items": 1}
+    ))
+    if not unreleased:
+        return 0
+
+    quantities = defaultdict(int)
+    for reservation in unreleased:
+        for item in reservation["items"]:
+            quantities[item["product_id"]] += item["quantity"]
+    release_quantities(quantities)
+    reservations_collection.update_many(
+        {"_id": {"$in": [reservation["_id"] for reservation in unreleased]}},
+        {"$set": {"closed_at": datetime.utcnow()}}
+    )
+    return len(unreleased)
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import json_util
+
+from common.database import get_collection
+from common.metrics import register_collector
+
+_inflight: Dict[str, asyncio.Future] = {}
+_stats = {"executed": 0, "coalesced": 0}
+
+
+def query_key(collection_name: str, filter: Optional[dict] = None, projection=None, **options) -> str:
+    return json_util.dumps([collection_name, filter or {}, projection, options], sort_keys=True)
+
+
+async def coalesce(key: str, fn: Callable[[], Any]) -> Any:
+    """Run the blocking ``fn`` in a worker thread, once per ``key`` at a time.
+
+    Callers arriving while a call for the same key is in flight wait for it
+    and receive the same result object, so they must not mutate it. The
+    call runs as its own task, so a caller that is cancelled (say, by a
+    client disconnect) stops waiting without failing the others.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(asyncio.to_thread(fn))
+        _inflight[key] = task
+        _stats["executed"] += 1
+        task.add_done_callback(lambda done: _finished(key, done))
+    return await asyncio.shield(task)
+
+
+def _finished(key: str, task: asyncio.Future) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception as retrieved when every caller had gone.
+    if not task.cancelled():
+        task.exception()
+
+
+async def coalesced_find_one(collection_name: str, filter: dict, projection=None) -> Optional[dict]:
+    key = query_key(collection_name, filter, projection, op="find_one")
+    return await coalesce(
+        key,
+        lambda: get_collection(collection_name).find_one(filter, projection)
+    )
+
+
+async def coalesced_find(
+    collection_name: str,
+    filter: Optional[dict] = None,
+    projection=None,
+    sort: Optional[list] = None,
+    limit: int = 0,
+    scope: Optional[str] = None
+) -> List[dict]:
+    """Coalesced ``find``. Callers that cache the result under a version pass
+    it as ``scope``, so a query started before a write is never shared with
+    a reader that has already seen the write."""
+    def run():
+        cursor = get_collection(collection_name).find(filter or {}, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    key = query_key(collection_name, filter, projection, op="find", sort=sort, limit=limit, scope=scope)
+    return await coalesce(key, run)
+
+
+register_collector("singleflight", lambda: {**_stats, "inflight": len(_inflight)})
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import AsyncIterator, Iterable, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from common.config import settings
+from common.database import get_collection
+from common.events import EVENTS_COLLECTION, Event, EventType, event_from_doc, subscribe
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: Event) -> str:
+    payload = json.dumps(jsonable_encoder({
+        "entity_id": event.entity_id,
+        "data": event.data,
+        "created_at": event.created_at
+    }))
+    return f"id: {event.id}\nevent: {event.type.value}\ndata: {payload}\n\n"
+
+
+class _Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event: Event) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broadcaster:
+    """Fans events from the local event bus out to every open SSE connection.
+
+    One bus subscription is shared by all connections, so N dashboards cost
+    N queue pushes rather than N outbox readers. A connection whose queue
+    fills up is closed; the client reconnects with Last-Event-ID and catches
+    up from the outbox.
+    """
+
+    def __init__(self, name: str, event_types: Iterable[EventType]):
+        self.name = name
+        self.event_types: List[EventType] = list(event_types)
+        self.delivered = 0
+        self.dropped_connections = 0
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        subscribe(self.event_types, self._on_event)
+        _broadcasters[name] = self
+
+    def _on_event(self, event: Event) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The connection's loop has shut down.
+                self.close(subscription)
+
+    def open(self) -> _Subscription:
+        subscription = _Subscription(asyncio.get_running_loop(), settings.SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def close(self, subscription: _Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def missed_events(self, last_event_id: str) -> List[Event]:
+        """Outbox events after ``last_event_id``, oldest first."""
+        try:
+            after = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            return []
+        cursor = get_collection(EVENTS_COLLECTION).find({
+            "_id": {"$gt": after},
+            "type": {"$in": [event_type.value for event_type in self.event_types]}
+        }).sort("_id", 1).limit(settings.SSE_REPLAY_LIMIT)
+        return [event_from_doc(doc) for doc in cursor]
+
+    async def stream(self, request: Request, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        # Subscribe before replaying so nothing published in between is lost;
+        # replayed ids are skipped when they come through the live queue too.
+        subscription = self.open()
+        try:
+            replayed = set()
+            if last_event_id:
+                for event in await asyncio.to_thread(self.missed_events, last_event_id):
+                    replayed.add(event.id)
+                    yield format_event(event)
+            yield f"retry: {int(settings.SSE_HEARTBEAT_SECONDS * 1000)}\n\n"
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        timeout=settings.SSE_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event.id in replayed:
+                    continue
+                yield format_event(event)
+                self.delivered += 1
+                if subscription.overflowed and subscription.queue.empty():
+                    self.dropped_connections += 1
+                    logger.warning("Closing slow %s event stream", self.name)
+                    break
+        finally:
+            self.close(subscription)
+
+    def response(self, request: Request) -> StreamingResponse:
+        last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+        return StreamingResponse(
+            self.stream(request, last_event_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._subscriptions),
+            "delivered": self.delivered,
+            "dropped_connections": self.dropped_connections
+        }
+
+
+_broadcasters = {}
+
+register_collector("sse", lambda: {name: broadcaster.stats() for name, broadcaster in list(_broadcasters.items())})
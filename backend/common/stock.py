@@ -0,0 +1,269 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+
+from common.catalog_changes import versioned
+from common.category_stats import apply_product_changes, stock_change
+from common.database import get_collection
+from common.events import EventType, publish_many
+from common.stock_shards import UNSHARDED_FILTER, return_stock, sharded_stock_total, take_stock
+
+STOCK_PROJECTION = {"title": 1, "stock": 1, "category_id": 1, "sharded_stock": 1}
+
+# Compare-and-set rounds before a bulk row is reported as a conflict.
+BULK_CAS_ATTEMPTS = 3
+
+
+def stock_history_entry(change: dict) -> dict:
+    return {
+        "product_id": change["product_id"],
+        "previous_stock": change["previous_stock"],
+        "new_stock": change["new_stock"],
+        "change": change["new_stock"] - change["previous_stock"],
+        "reason": change.get("reason"),
+        "updated_by": change.get("updated_by"),
+        "created_at": change.get("created_at") or datetime.utcnow()
+    }
+
+
+def record_stock_changes(changes: List[dict], history: bool = True) -> None:
+    """Fan out already-applied stock changes in one write per target.
+
+    Each change carries ``product_id``, ``category_id``, ``previous_stock``
+    and ``new_stock`` (plus ``reason``/``updated_by`` for the history row).
+    """
+    if not changes:
+        return
+    if history:
+        get_collection("stock_history").insert_many(
+            [stock_history_entry(change) for change in changes],
+            ordered=False
+        )
+    apply_product_changes(
+        stock_change(change.get("category_id"), change["previous_stock"], change["new_stock"])
+        for change in changes
+    )
+    publish_many([
+        (EventType.STOCK_CHANGED, change["product_id"], {
+            "previous_stock": change["previous_stock"],
+            "new_stock": change["new_stock"],
+            "category_id": change.get("category_id"),
+            "title": change.get("title")
+        })
+        for change in changes
+    ])
+
+
+def adjust_stock(
+    object_id: ObjectId,
+    stock: Optional[int] = None,
+    delta: Optional[int] = None,
+    reason: Optional[str] = None,
+    updated_by: Optional[str] = None
+) -> dict:
+    """Set ``stock`` or apply ``delta`` in one atomic find-and-modify.
+
+    The previous level comes back from the same round trip, so a concurrent
+    decrement can't slip in between the read and the write. Negative deltas
+    never take stock below zero.
+    """
+    products_collection = get_collection("products")
+
+    query = {"_id": object_id, **UNSHARDED_FILTER}
+    if stock is not None:
+        update = {"$set": {"stock": stock}}
+    else:
+        update = {"$inc": {"stock": delta}}
+        if delta < 0:
+            query["stock"] = {"$gte": -delta}
+
+    before = products_collection.find_one_and_update(
+        query,
+        versioned(update),
+        projection=STOCK_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if before is None:
+        product = products_collection.find_one({"_id": object_id}, STOCK_PROJECTION)
+        if product and product.get("sharded_stock"):
+            return _adjust_sharded_stock(product, stock, delta, reason, updated_by)
+        if "stock" in query and product:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Insufficient stock"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+
+    previous_stock = before.get("stock", 0)
+    change = {
+        "product_id": str(object_id),
+        "title": before["title"],
+        "category_id": before.get("category_id"),
+        "previous_stock": previous_stock,
+        "new_stock": stock if stock is not None else previous_stock + delta,
+        "reason": reason,
+        "updated_by": updated_by
+    }
+    record_stock_changes([change])
+    return change
+
+
+def _adjust_sharded_stock(
+    product: dict,
+    stock: Optional[int],
+    delta: Optional[int],
+    reason: Optional[str],
+    updated_by: Optional[str]
+) -> dict:
+    """Apply a delta to a sharded product's counters.
+
+    Only the history row is written here; the stock view, category counts
+    and events follow from the shard reconciler.
+    """
+    if stock is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stock is sharded for this product; adjust it with a delta"
+        )
+
+    product_id = str(product["_id"])
+    if delta >= 0:
+        return_stock(product_id, delta, product["sharded_stock"])
+    elif not take_stock(product_id, -delta, product["sharded_stock"]):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Insufficient stock"
+        )
+
+    new_stock = sharded_stock_total(product_id) or 0
+    change = {
+        "product_id": product_id,
+        "title": product["title"],
+        "category_id": product.get("category_id"),
+        "previous_stock": new_stock - delta,
+        "new_stock": new_stock,
+        "reason": reason,
+        "updated_by": updated_by
+    }
+    get_collection("stock_history").insert_one(stock_history_entry(change))
+    return change
+
+
+def _plan_product_rows(rows: List[dict], stock: int):
+    """Apply one product's rows in order, starting from ``stock``.
+
+    Returns the final level and ``(row, previous, new)`` for every row that
+    applies; rows that would go below zero are marked and skipped.
+    """
+    applied = []
+    for row in rows:
+        new_stock = row["stock"] if row.get("stock") is not None else stock + row["delta"]
+        if new_stock < 0:
+            row["status"] = "insufficient_stock"
+            continue
+        applied.append((row, stock, new_stock))
+        stock = new_stock
+    return stock, applied
+
+
+def bulk_adjust_stock(rows: List[dict], updated_by: Optional[str] = None) -> None:
+    """Apply many stock rows with one bulk write and one history insert.
+
+    Each row has ``product_id`` (ObjectId) and either ``stock`` or ``delta``,
+    plus an optional ``reason``. Rows for the same product are applied in
+    order. Every product is written with a compare-and-set against the level
+    read just before, so a concurrent change is retried instead of
+    overwritten. Rows are updated in place with ``status`` and, when applied,
+    ``previous_stock``/``new_stock``.
+    """
+    products_collection = get_collection("products")
+
+    rows_by_product = defaultdict(list)
+    for row in rows:
+        rows_by_product[row["product_id"]].append(row)
+
+    changes = []
+    pending = list(rows_by_product)
+    for _ in range(BULK_CAS_ATTEMPTS):
+        if not pending:
+            break
+        snapshot = {
+            product["_id"]: product
+            for product in products_collection.find({"_id": {"$in": pending}}, STOCK_PROJECTION)
+        }
+
+        planned = {}
+        for object_id in pending:
+            product_rows = rows_by_product[object_id]
+            if object_id not in snapshot:
+                for row in product_rows:
+                    row["status"] = "not_found"
+                continue
+            if snapshot[object_id].get("sharded_stock"):
+                for row in product_rows:
+                    row["status"] = "sharded"
+                continue
+            for row in product_rows:
+                row.pop("status", None)
+            # Matched as read: None also matches a product with no stock field.
+            current = snapshot[object_id].get("stock")
+            final, applied = _plan_product_rows(product_rows, current or 0)
+            if applied:
+                planned[object_id] = (current, final, applied)
+
+        if not planned:
+            break
+
+        # Every write in this round carries the same token, so the products
+        # it did update can be found again whatever has changed them since.
+        write_token = ObjectId()
+        result = products_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": object_id, "stock": current, **UNSHARDED_FILTER},
+                    versioned({"$set": {"stock": final, "stock_write": write_token}})
+                )
+                for object_id, (current, final, _) in planned.items()
+            ],
+            ordered=False
+        )
+
+        conflicted = set()
+        if result.matched_count < len(planned):
+            # bulk_write doesn't say which filters missed.
+            written = {
+                product["_id"]
+                for product in products_collection.find({"_id": {"$in": list(planned)}, "stock_write": write_token}, {"_id": 1})
+            }
+            conflicted = set(planned) - written
+
+        for object_id, (_, _, applied) in planned.items():
+            if object_id in conflicted:
+                continue
+            product = snapshot[object_id]
+            for row, previous_stock, new_stock in applied:
+                row.update(status="updated", previous_stock=previous_stock, new_stock=new_stock)
+                changes.append({
+                    "product_id": str(object_id),
+                    "title": product.get("title"),
+                    "category_id": product.get("category_id"),
+                    "previous_stock": previous_stock,
+                    "new_stock": new_stock,
+                    "reason": row.get("reason"),
+                    "updated_by": updated_by
+                })
+        pending = list(conflicted)
+
+    for object_id in pending:
+        for row in rows_by_product[object_id]:
+            row.setdefault("status", "conflict")
+
+    record_stock_changes(changes)
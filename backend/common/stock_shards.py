@@ -0,0 +1,257 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+
+from common.catalog_changes import versioned
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+SHARDS_COLLECTION = "stock_shards"
+
+# A return that finds neither its shard nor an unsharded product is racing
+# disable_sharding; it retries until the fold is written.
+RETURN_ATTEMPTS = 5
+RETURN_RETRY_SECONDS = 0.05
+
+# A product's stock lives in shards while ``products.sharded_stock`` holds
+# the shard count; ``products.stock`` is then a view kept by the reconciler.
+SHARDED_FILTER = {"sharded_stock": {"$exists": True}}
+UNSHARDED_FILTER = {"sharded_stock": {"$exists": False}}
+
+
+class _ShardStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.takes = 0
+        self.first_probe_hits = 0
+        self.fallbacks = 0
+        self.split_takes = 0
+        self.failures = 0
+        # Refreshed by the reconciler.
+        self.shard_counts: Dict[str, int] = {}
+
+    def count(self, field: str) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> dict:
+        return {
+            "takes": self.takes,
+            "first_probe_hits": self.first_probe_hits,
+            # Takes whose random shard was empty or lost a race.
+            "contended": self.takes - self.first_probe_hits,
+            "fallbacks": self.fallbacks,
+            "split_takes": self.split_takes,
+            "failures": self.failures,
+            "sharded_products": len(self.shard_counts),
+            "shards": dict(self.shard_counts)
+        }
+
+
+shard_stats = _ShardStats()
+
+
+def shard_id(product_id: str, shard: int) -> str:
+    return f"{product_id}:{shard}"
+
+
+def split_stock(stock: int, shards: int) -> List[int]:
+    base, extra = divmod(stock, shards)
+    return [base + (1 if shard < extra else 0) for shard in range(shards)]
+
+
+def enable_sharding(object_id: ObjectId, shards: int) -> dict:
+    """Split the product's stock across ``shards`` counters.
+
+    The shards are written first and the product is only flagged if its
+    stock is still what was split, so a decrement that lands in between is
+    never lost.
+    """
+    products_collection = get_collection("products")
+    shards_collection = get_collection(SHARDS_COLLECTION)
+    product_id = str(object_id)
+
+    product = products_collection.find_one({"_id": object_id}, {"stock": 1, "sharded_stock": 1})
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    if product.get("sharded_stock"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stock is already sharded for this product"
+        )
+
+    stock = product.get("stock", 0)
+    shards_collection.delete_many({"product_id": product_id})
+    shards_collection.insert_many([
+        {"_id": shard_id(product_id, shard), "product_id": product_id, "shard": shard, "stock": level}
+        for shard, level in enumerate(split_stock(stock, shards))
+    ])
+    flagged = products_collection.find_one_and_update(
+        {"_id": object_id, "stock": stock, **UNSHARDED_FILTER},
+        {"$set": {"sharded_stock": shards}},
+        projection={"stock": 1, "sharded_stock": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if flagged is None:
+        shards_collection.delete_many({"product_id": product_id})
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stock changed while sharding; retry"
+        )
+    shard_stats.shard_counts[product_id] = shards
+    return flagged
+
+
+def disable_sharding(object_id: ObjectId) -> dict:
+    """Fold the shards back into ``products.stock``.
+
+    Each shard is removed with an atomic delete that returns its level, so
+    takes racing the fold either land before it (and are counted) or fail.
+    Returns the stock change from the last reconciled level to the folded
+    total, for the caller to pass to record_stock_changes.
+    """
+    products_collection = get_collection("products")
+    shards_collection = get_collection(SHARDS_COLLECTION)
+    product_id = str(object_id)
+
+    product = products_collection.find_one({"_id": object_id, **SHARDED_FILTER}, {"sharded_stock": 1})
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found or stock not sharded"
+        )
+
+    total = 0
+    for shard in range(product["sharded_stock"]):
+        removed = shards_collection.find_one_and_delete({"_id": shard_id(product_id, shard)}, projection={"stock": 1})
+        if removed:
+            total += removed.get("stock", 0)
+    before = products_collection.find_one_and_update(
+        {"_id": object_id},
+        versioned({"$set": {"stock": total}, "$unset": {"sharded_stock": ""}}),
+        projection={"title": 1, "stock": 1, "category_id": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    shard_stats.shard_counts.pop(product_id, None)
+    return {
+        "product_id": product_id,
+        "title": before.get("title") if before else None,
+        "category_id": before.get("category_id") if before else None,
+        "previous_stock": before.get("stock", 0) if before else total,
+        "new_stock": total
+    }
+
+
+def shard_levels(product_id: str) -> List[dict]:
+    return list(get_collection(SHARDS_COLLECTION).find({"product_id": product_id}, {"shard": 1, "stock": 1}).sort("shard", 1))
+
+
+def take_stock(product_id: str, quantity: int, shards: int, held: Optional[int] = None) -> bool:
+    """Take ``quantity`` units from the product's shards.
+
+    With ``held`` (the units of this take already reserved for the caller),
+    units reserved for other buyers are left alone like on the unsharded
+    path: ``products.reserved`` can't be checked atomically against the
+    shards, so the take happens first and is undone if the shards no
+    longer cover the other reservations.
+    """
+    if not _take_from_shards(product_id, quantity, shards):
+        return False
+    if held is not None and not _covers_reservations(product_id, held):
+        return_stock(product_id, quantity, shards)
+        shard_stats.count("failures")
+        return False
+    return True
+
+
+def _covers_reservations(product_id: str, held: int) -> bool:
+    product = get_collection("products").find_one({"_id": ObjectId(product_id)}, {"reserved": 1})
+    reserved_for_others = (product or {}).get("reserved", 0) - held
+    return reserved_for_others <= 0 or (sharded_stock_total(product_id) or 0) >= reserved_for_others
+
+
+def _take_from_shards(product_id: str, quantity: int, shards: int) -> bool:
+    """Try one random shard, then whichever shard holds the most, and only
+    when no single shard can cover it split the take across shards."""
+    shards_collection = get_collection(SHARDS_COLLECTION)
+    shard_stats.count("takes")
+
+    probe = shards_collection.update_one(
+        {"_id": shard_id(product_id, random.randrange(shards)), "stock": {"$gte": quantity}},
+        {"$inc": {"stock": -quantity}}
+    )
+    if probe.modified_count:
+        shard_stats.count("first_probe_hits")
+        return True
+
+    shard_stats.count("fallbacks")
+    fullest = shards_collection.find_one_and_update(
+        {"product_id": product_id, "stock": {"$gte": quantity}},
+        {"$inc": {"stock": -quantity}},
+        sort=[("stock", -1)],
+        projection={"_id": 1}
+    )
+    if fullest:
+        return True
+
+    taken = []
+    remaining = quantity
+    for shard in shards_collection.find({"product_id": product_id, "stock": {"$gt": 0}}).sort("stock", -1):
+        amount = min(shard["stock"], remaining)
+        if shards_collection.update_one(
+            {"_id": shard["_id"], "stock": {"$gte": amount}},
+            {"$inc": {"stock": -amount}}
+        ).modified_count:
+            taken.append((shard["_id"], amount))
+            remaining -= amount
+        if not remaining:
+            shard_stats.count("split_takes")
+            return True
+
+    for taken_id, amount in taken:
+        shards_collection.update_one({"_id": taken_id}, {"$inc": {"stock": amount}})
+    shard_stats.count("failures")
+    return False
+
+
+def return_stock(product_id: str, quantity: int, shards: int) -> None:
+    """Put units back on a shard, or on the product if sharding was turned off since they were taken."""
+    for _ in range(RETURN_ATTEMPTS):
+        returned = get_collection(SHARDS_COLLECTION).update_one(
+            {"_id": shard_id(product_id, random.randrange(shards))},
+            {"$inc": {"stock": quantity}}
+        )
+        if returned.matched_count:
+            return
+        # Only once disable_sharding has written the folded total, or the
+        # $inc would be overwritten by it.
+        returned = get_collection("products").update_one(
+            {"_id": ObjectId(product_id), **UNSHARDED_FILTER},
+            versioned({"$inc": {"stock": quantity}})
+        )
+        if returned.matched_count:
+            return
+        time.sleep(RETURN_RETRY_SECONDS)
+    logger.error("Could not return %s units of product %s: shards and product both unavailable", quantity, product_id)
+
+
+def sharded_stock_total(product_id: str) -> Optional[int]:
+    rows = list(get_collection(SHARDS_COLLECTION).aggregate([
+        {"$match": {"product_id": product_id}},
+        {"$group": {"_id": None, "stock": {"$sum": "$stock"}}}
+    ]))
+    return rows[0]["stock"] if rows else None
+
+
+register_collector("stock_shards", shard_stats.snapshot)
@@ -3,14 +3,21 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
 from common.config import settings
+from common.metrics import collect_metrics
 from common.errors import setup_exception_handlers
+from common.background import PeriodicTask
+from common.popularity import popularity_counters
 from app.routes import router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    flush_task = PeriodicTask("popularity_flush", settings.POPULARITY_FLUSH_SECONDS, popularity_counters.flush)
+    flush_task.start()
     yield
+    flush_task.stop()
+    popularity_counters.flush()
     close_mongo_connection()
 
 
@@ -37,4 +44,9 @@ async def health_check():
     return {"status": "healthy", "service": "auth"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/auth")
@@ -8,6 +8,7 @@ from app.models import (
 from common.security import hash_password, verify_password, create_access_token, create_refresh_token, decode_token
 from common.database import get_collection
 from common.auth_middleware import get_current_user
+from common.popularity import record_cart_add
 
 router = APIRouter(tags=["Authentication"])
 
@@ -234,6 +235,7 @@ async def add_to_cart(
         {"_id": ObjectId(current_user["user_id"])},
         {"$set": {"cart": cart_items}}
     )
+    record_cart_add(item.product_id)
     
     return calculate_cart_totals(cart_items)
 
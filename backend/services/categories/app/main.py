@@ -2,7 +2,10 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
+from common.events import start_event_listener, stop_event_listener
 from common.config import settings
+from common.category_stats import ensure_category_stats
+from common.metrics import collect_metrics
 from common.errors import setup_exception_handlers
 from app.routes import router
 
@@ -10,7 +13,10 @@ from app.routes import router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    ensure_category_stats()
+    start_event_listener()
     yield
+    stop_event_listener()
     close_mongo_connection()
 
 
@@ -37,4 +43,9 @@ async def health_check():
     return {"status": "healthy", "service": "categories"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/categories")
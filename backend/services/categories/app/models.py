@@ -22,6 +22,8 @@ class CategoryUpdate(BaseModel):
 class CategoryResponse(CategoryBase):
     id: str
     created_at: datetime
+    product_count: Optional[int] = None
+    in_stock_count: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -1,13 +1,35 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
 from app.models import CategoryCreate, CategoryUpdate, CategoryResponse, CategoryListResponse
 from common.database import get_collection
 from common.auth_middleware import require_admin
+from common.cache import VersionStamp, get_cache
+from common.catalog_changes import record_tombstone, versioned
+from common.category_stats import get_category_stats, rebuild_category_stats
+from common.config import settings
+from common.singleflight import coalesced_find
+from common.events import EventType, publish, publish_many, subscribe
 
 router = APIRouter(tags=["Categories"])
 
+category_version = VersionStamp("categories", settings.CATEGORY_VERSION_CHECK_SECONDS)
+# Holds the sorted category list keyed by version, so a bump on any replica
+# turns the old snapshot into a miss.
+category_cache = get_cache("categories", max_entries=2)
+category_counts_cache = get_cache("category_counts", ttl=settings.CATEGORY_COUNTS_TTL_SECONDS)
+
+
+def expire_category_version(event):
+    category_version.expire()
+
+
+subscribe(
+    [EventType.CATEGORY_CREATED, EventType.CATEGORY_UPDATED, EventType.CATEGORY_DELETED],
+    expire_category_version
+)
+
 
 def category_to_response(category: dict) -> CategoryResponse:
     return CategoryResponse(
@@ -19,12 +41,36 @@ def category_to_response(category: dict) -> CategoryResponse:
     )
 
 
+async def get_category_snapshot() -> dict:
+    """Return the cached ``{"categories": [...], "by_id": {...}}`` snapshot."""
+    version = category_version.current()
+    key = f"v{version}"
+    snapshot = category_cache.get(key)
+    if snapshot is None:
+        categories_docs = await coalesced_find("categories", sort=[("name", 1)], scope=key)
+        categories = [category_to_response(cat) for cat in categories_docs]
+        snapshot = {
+            "categories": categories,
+            "by_id": {category.id: category for category in categories}
+        }
+        category_cache.set(key, snapshot)
+    return snapshot
+
+
 @router.get("", response_model=CategoryListResponse)
-async def get_categories():
-    categories_collection = get_collection("categories")
+async def get_categories(
+    include_counts: bool = Query(False, description="Include product and in-stock counts")
+):
+    snapshot = await get_category_snapshot()
+    categories = snapshot["categories"]
     
-    categories_cursor = categories_collection.find().sort("name", 1)
-    categories = [category_to_response(cat) for cat in categories_cursor]
+    if include_counts:
+        counts = category_counts_cache.get_or_load("all", get_category_stats)
+        empty = {"product_count": 0, "in_stock_count": 0}
+        categories = [
+            category.model_copy(update=counts.get(category.id, empty))
+            for category in categories
+        ]
     
     return CategoryListResponse(
         categories=categories,
@@ -32,6 +78,13 @@ async def get_categories():
     )
 
 
+@router.post("/stats/rebuild", status_code=status.HTTP_204_NO_CONTENT)
+async def rebuild_stats(current_user: dict = Depends(require_admin)):
+    rebuild_category_stats()
+    category_counts_cache.clear()
+    return None
+
+
 @router.get("/{category_id}", response_model=CategoryResponse)
 async def get_category(category_id: str):
     try:
@@ -42,6 +95,11 @@ async def get_category(category_id: str):
             detail="Invalid category ID format"
         )
     
+    snapshot = await get_category_snapshot()
+    if category_id in snapshot["by_id"]:
+        return snapshot["by_id"][category_id]
+    
+    # Not in this replica's snapshot yet (or gone); ask Mongo before a 404.
     categories_collection = get_collection("categories")
     category = categories_collection.find_one({"_id": object_id})
     
@@ -71,9 +129,15 @@ async def create_category(
     category_dict = category_data.model_dump()
     category_dict["created_at"] = datetime.utcnow()
     
-    result = categories_collection.insert_one(category_dict)
+    # Upserted rather than inserted so the server stamps its change version.
+    new_id = ObjectId()
+    categories_collection.update_one({"_id": new_id}, versioned({"$setOnInsert": category_dict}), upsert=True)
+    
+    created_category = categories_collection.find_one({"_id": new_id})
+    
+    category_version.bump()
+    publish(EventType.CATEGORY_CREATED, str(new_id), {"name": created_category["name"]})
     
-    created_category = categories_collection.find_one({"_id": result.inserted_id})
     return category_to_response(created_category)
 
 
@@ -121,10 +185,20 @@ async def update_category(
     
     categories_collection.update_one(
         {"_id": object_id},
-        {"$set": update_data}
+        versioned({"$set": update_data})
     )
     
     updated_category = categories_collection.find_one({"_id": object_id})
+    
+    category_version.bump()
+    events = [(EventType.CATEGORY_UPDATED, category_id, {"fields": sorted(update_data)})]
+    if updated_category["name"] != existing_category["name"]:
+        events.append((EventType.CATEGORY_RENAMED, category_id, {
+            "previous_name": existing_category["name"],
+            "name": updated_category["name"]
+        }))
+    publish_many(events)
+    
     return category_to_response(updated_category)
 
 
@@ -151,4 +225,8 @@ async def delete_category(
             detail="Category not found"
         )
     
+    record_tombstone("category", category_id)
+    category_version.bump()
+    publish(EventType.CATEGORY_DELETED, category_id)
+    
     return None
@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from common.cache import VersionStamp, get_cache
+from common.config import settings
+from common.database import get_collection
+from common.events import Event, EventType, subscribe
+
+ALERTS_COLLECTION = "stock_alerts"
+RULES_COLLECTION = "alert_rules"
+
+rules_version = VersionStamp("alert_rules", settings.ALERT_RULES_CHECK_SECONDS)
+rules_cache = get_cache("alert_rules", max_entries=2)
+
+
+def rule_id(scope: str, target_id: str) -> str:
+    return f"{scope}:{target_id}"
+
+
+def load_rules() -> dict:
+    """Thresholds keyed by ``product:<id>`` / ``category:<id>``."""
+    return rules_cache.get_or_load(
+        f"v{rules_version.current()}",
+        lambda: {
+            rule["_id"]: rule["threshold"]
+            for rule in get_collection(RULES_COLLECTION).find({}, {"threshold": 1})
+        }
+    )
+
+
+def threshold_for(product_id: str, category_id: Optional[str]) -> int:
+    rules = load_rules()
+    product_rule = rule_id("product", product_id)
+    if product_rule in rules:
+        return rules[product_rule]
+    if category_id and rule_id("category", category_id) in rules:
+        return rules[rule_id("category", category_id)]
+    return settings.LOW_STOCK_THRESHOLD
+
+
+def resolve_alerts(product_id: str, stock: Optional[int] = None) -> None:
+    now = datetime.utcnow()
+    update = {"status": "resolved", "resolved_at": now, "updated_at": now}
+    if stock is not None:
+        update["stock"] = stock
+    get_collection(ALERTS_COLLECTION).update_many(
+        {"product_id": product_id, "active": True},
+        {"$set": update, "$unset": {"active": ""}}
+    )
+
+
+def evaluate_stock_change(event: Event) -> None:
+    """Open, refresh or resolve the product's alert for a stock change.
+
+    Changes that stay above the threshold cost no writes. Every replica
+    and the poll listener evaluate events, in no guaranteed order, so the
+    alert follows the product's current stock rather than the event's: a
+    late, older event can't reopen an alert a newer one resolved. The
+    partial unique index on active alerts keeps one alert per product.
+    """
+    data = event.data
+    previous_stock = data.get("previous_stock")
+    threshold = threshold_for(event.entity_id, data.get("category_id"))
+
+    if data["new_stock"] > threshold and previous_stock is not None and previous_stock > threshold:
+        return
+
+    product = get_collection("products").find_one({"_id": ObjectId(event.entity_id)}, {"stock": 1})
+    if product is None:
+        return
+    stock = product.get("stock", 0)
+    if stock > threshold:
+        resolve_alerts(event.entity_id, stock)
+        return
+
+    now = datetime.utcnow()
+    fields = {
+        "stock": stock,
+        "threshold": threshold,
+        "category_id": data.get("category_id"),
+        "updated_at": now
+    }
+    if data.get("title"):
+        fields["title"] = data["title"]
+    try:
+        get_collection(ALERTS_COLLECTION).update_one(
+            {"product_id": event.entity_id, "active": True},
+            {"$set": fields, "$setOnInsert": {"status": "open", "opened_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another replica opened the same alert first.
+        pass
+
+
+def resolve_deleted_product(event: Event) -> None:
+    resolve_alerts(event.entity_id)
+
+
+subscribe(EventType.STOCK_CHANGED, evaluate_stock_change)
+subscribe(EventType.PRODUCT_DELETED, resolve_deleted_product)
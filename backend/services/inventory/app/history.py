@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from common.database import get_collection
+
+DAILY_COLLECTION = "stock_history_daily"
+JOB_STATE_COLLECTION = "job_state"
+ROLLUP_JOB = "stock_history_rollup"
+
+# Days aggregated per pass, to keep each aggregation bounded.
+ROLLUP_WINDOW = timedelta(days=7)
+
+
+def start_of_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_stock_history(since: datetime, until: datetime) -> None:
+    """Aggregate raw stock_history rows in [since, until) into daily rollups."""
+    get_collection("stock_history").aggregate([
+        {"$match": {"created_at": {"$gte": since, "$lt": until}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": {
+                "product_id": "$product_id",
+                "day": {"$dateTrunc": {"date": "$created_at", "unit": "day"}}
+            },
+            "opening_stock": {"$first": "$previous_stock"},
+            "closing_stock": {"$last": "$new_stock"},
+            "min_stock": {"$min": "$new_stock"},
+            "max_stock": {"$max": "$new_stock"},
+            "net_change": {"$sum": "$change"},
+            "changes": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": {"$concat": [
+                "$_id.product_id", ":",
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.day"}}
+            ]},
+            "product_id": "$_id.product_id",
+            "day": "$_id.day",
+            "opening_stock": 1,
+            "closing_stock": 1,
+            "min_stock": 1,
+            "max_stock": 1,
+            "net_change": 1,
+            "changes": 1
+        }},
+        {"$merge": {"into": DAILY_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ], allowDiskUse=True)
+
+
+def run_stock_history_rollup() -> None:
+    """Roll up every complete day since the last run, a window at a time."""
+    state_collection = get_collection(JOB_STATE_COLLECTION)
+    state = state_collection.find_one({"_id": ROLLUP_JOB})
+
+    if state:
+        since = state["rolled_up_to"]
+    else:
+        oldest = get_collection("stock_history").find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+        if not oldest:
+            return
+        since = start_of_day(oldest["created_at"])
+
+    today = start_of_day(datetime.utcnow())
+    while since < today:
+        until = min(since + ROLLUP_WINDOW, today)
+        rollup_stock_history(since, until)
+        state_collection.update_one(
+            {"_id": ROLLUP_JOB},
+            {"$set": {"rolled_up_to": until, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        since = until
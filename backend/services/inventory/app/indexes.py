@@ -0,0 +1,70 @@
+from pymongo.errors import OperationFailure
+from common.config import settings
+from common.database import get_collection, get_database
+
+
+def ensure_indexes():
+    products_collection = get_collection("products")
+    # Keyset pagination by title; stock and category_id are included so the
+    # inventory listing (and its max_stock filter) is answered from the index.
+    products_collection.create_index(
+        [("title", 1), ("_id", 1), ("stock", 1), ("category_id", 1)],
+        name="inventory_title"
+    )
+    products_collection.create_index(
+        [("category_id", 1), ("title", 1), ("_id", 1), ("stock", 1)],
+        name="inventory_category_title"
+    )
+
+    stock_history_collection = get_collection("stock_history")
+    stock_history_collection.create_index(
+        [("product_id", 1), ("created_at", -1), ("_id", -1)],
+        name="history_product_time"
+    )
+    # Raw rows expire after the retention period; long-range charts read the
+    # daily rollups instead.
+    retention_seconds = settings.STOCK_HISTORY_RETENTION_DAYS * 86400
+    try:
+        stock_history_collection.create_index(
+            "created_at",
+            name="history_retention",
+            expireAfterSeconds=retention_seconds
+        )
+    except OperationFailure:
+        get_database().command(
+            "collMod",
+            "stock_history",
+            index={"name": "history_retention", "expireAfterSeconds": retention_seconds}
+        )
+
+    get_collection("stock_history_daily").create_index(
+        [("product_id", 1), ("day", 1)],
+        name="daily_product_day"
+    )
+
+    alerts_collection = get_collection("stock_alerts")
+    # At most one active (open or acknowledged) alert per product.
+    alerts_collection.create_index(
+        "product_id",
+        name="alerts_active_product",
+        unique=True,
+        partialFilterExpression={"active": True}
+    )
+    alerts_collection.create_index(
+        [("status", 1), ("opened_at", -1), ("_id", -1)],
+        name="alerts_status_opened"
+    )
+
+    get_collection("stock_shards").create_index(
+        [("product_id", 1), ("stock", -1)],
+        name="shards_product_stock"
+    )
+
+    reservations_collection = get_collection("stock_reservations")
+    # The sweeper's expiry claim and its scan for unreleased expired holds.
+    reservations_collection.create_index(
+        [("status", 1), ("expires_at", 1)],
+        name="reservations_status_expiry"
+    )
+    # Closed reservations are only kept for a day, for support lookups.
+    reservations_collection.create_index("closed_at", name="reservations_closed_ttl", expireAfterSeconds=86400)
@@ -2,15 +2,49 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
+from common.events import start_event_listener, stop_event_listener
 from common.config import settings
+from common.background import PeriodicTask
+from common.metrics import collect_metrics
 from common.errors import setup_exception_handlers
+from common.reservations import sweep_expired_reservations
 from app.routes import router
+from app.indexes import ensure_indexes
+from app.history import run_stock_history_rollup
+from app.shards import reconcile_sharded_stock
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    ensure_indexes()
+    start_event_listener()
+    rollup_task = PeriodicTask(
+        "stock_history_rollup",
+        settings.STOCK_HISTORY_ROLLUP_INTERVAL_SECONDS,
+        run_stock_history_rollup,
+        singleton=True
+    )
+    rollup_task.start()
+    sweep_task = PeriodicTask(
+        "reservation_sweep",
+        settings.RESERVATION_SWEEP_INTERVAL_SECONDS,
+        sweep_expired_reservations,
+        singleton=True
+    )
+    sweep_task.start()
+    shard_task = PeriodicTask(
+        "stock_shard_reconcile",
+        settings.STOCK_SHARD_RECONCILE_SECONDS,
+        reconcile_sharded_stock,
+        singleton=True
+    )
+    shard_task.start()
     yield
+    shard_task.stop()
+    sweep_task.stop()
+    rollup_task.stop()
+    stop_event_listener()
     close_mongo_connection()
 
 
@@ -37,4 +71,9 @@ async def health_check():
     return {"status": "healthy", "service": "inventory"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/inventory")
@@ -1,12 +1,43 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime
 
 
 class StockUpdate(BaseModel):
-    stock: int = Field(..., ge=0)
+    # Exactly one of: an absolute level, or a relative change (+N / -N).
+    stock: Optional[int] = Field(None, ge=0)
+    delta: Optional[int] = None
     reason: Optional[str] = None
 
+    @model_validator(mode="after")
+    def check_stock_or_delta(self):
+        if (self.stock is None) == (self.delta is None):
+            raise ValueError("Provide exactly one of stock or delta")
+        return self
+
+
+class BulkStockRow(StockUpdate):
+    product_id: str
+
+
+class BulkStockRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., min_length=1)
+
+
+class BulkStockResult(BaseModel):
+    row: int
+    product_id: Optional[str] = None
+    status: Literal["updated", "invalid", "not_found", "insufficient_stock", "conflict", "sharded"]
+    previous_stock: Optional[int] = None
+    new_stock: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkStockResponse(BaseModel):
+    results: List[BulkStockResult]
+    updated: int
+    failed: int
+
 
 class InventoryItem(BaseModel):
     product_id: str
@@ -17,7 +48,10 @@ class InventoryItem(BaseModel):
 
 class InventoryListResponse(BaseModel):
     items: List[InventoryItem]
-    total: int
+    # Number of matching items; only computed for the first page.
+    total: Optional[int] = None
+    limit: int
+    next_cursor: Optional[str] = None
 
 
 class StockHistoryEntry(BaseModel):
@@ -27,8 +61,98 @@ class StockHistoryEntry(BaseModel):
     new_stock: int
     change: int
     reason: Optional[str] = None
-    updated_by: str
+    updated_by: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class StockHistoryListResponse(BaseModel):
+    entries: List[StockHistoryEntry]
+    next_cursor: Optional[str] = None
+
+
+class DailyStockRollup(BaseModel):
+    product_id: str
+    day: datetime
+    opening_stock: int
+    closing_stock: int
+    min_stock: int
+    max_stock: int
+    net_change: int
+    changes: int
+
+
+class DailyStockRollupListResponse(BaseModel):
+    days: List[DailyStockRollup]
+
+
+class AlertRule(BaseModel):
+    scope: Literal["product", "category"]
+    target_id: str
+    threshold: int = Field(..., ge=0)
+
+
+class AlertRuleListResponse(BaseModel):
+    rules: List[AlertRule]
+    default_threshold: int
+
+
+class StockAlert(BaseModel):
+    id: str
+    product_id: str
+    title: Optional[str] = None
+    category_id: Optional[str] = None
+    status: Literal["open", "acknowledged", "resolved"]
+    stock: int
+    threshold: int
+    opened_at: datetime
+    updated_at: datetime
+    acknowledged_by: Optional[str] = None
+    resolved_at: Optional[datetime] = None
+
+
+class StockAlertListResponse(BaseModel):
+    alerts: List[StockAlert]
+    next_cursor: Optional[str] = None
+
+
+class ReservationItem(BaseModel):
+    product_id: str
+    quantity: int = Field(..., ge=1)
+
+
+class ReservationCreate(BaseModel):
+    items: List[ReservationItem] = Field(..., min_length=1)
+    # Defaults to RESERVATION_TTL_SECONDS; capped at RESERVATION_MAX_TTL_SECONDS.
+    ttl_seconds: Optional[int] = Field(None, ge=1)
+
+
+class ReservationResponse(BaseModel):
+    id: str
+    user_id: str
+    items: List[ReservationItem]
+    status: Literal["active", "consumed", "released", "expired"]
+    expires_at: datetime
+    created_at: datetime
+    order_id: Optional[str] = None
+
+
+class ProductAvailability(BaseModel):
+    product_id: str
+    stock: int
+    reserved: int
+    available: int
+
+
+class StockShardingUpdate(BaseModel):
+    shards: int = Field(..., ge=2)
+
+
+class StockShardsResponse(BaseModel):
+    product_id: str
+    # None when the product's stock isn't sharded.
+    shards: Optional[int] = None
+    stock: int
+    shard_levels: List[int] = []
@@ -1,38 +1,119 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
 from datetime import datetime
+import csv
+import io
+import json
 from bson import ObjectId
 from bson.errors import InvalidId
-from app.models import StockUpdate, InventoryItem, InventoryListResponse
+from pymongo import ReturnDocument
+from pydantic import ValidationError
+from app.models import (
+    StockUpdate, InventoryItem, InventoryListResponse,
+    BulkStockRow, BulkStockRequest, BulkStockResult, BulkStockResponse,
+    StockHistoryEntry, StockHistoryListResponse, DailyStockRollup, DailyStockRollupListResponse,
+    AlertRule, AlertRuleListResponse, StockAlert, StockAlertListResponse,
+    ReservationCreate, ReservationItem, ReservationResponse, ProductAvailability,
+    StockShardingUpdate, StockShardsResponse
+)
+from app.alerts import ALERTS_COLLECTION, RULES_COLLECTION, rule_id, rules_version
 from common.database import get_collection
-from common.auth_middleware import require_admin
+from common.auth_middleware import get_current_user, require_admin, require_admin_stream, UserRole
+from common.pagination import after_key, decode_cursor, encode_cursor
+from common.config import settings
+from common.events import EventType
+from common.reservations import (
+    RESERVATIONS_COLLECTION, available_stock, cancel_reservation, create_reservation
+)
+from common.sse import Broadcaster
+from common.stock import adjust_stock, bulk_adjust_stock, record_stock_changes
+from common.stock_shards import disable_sharding, enable_sharding, shard_levels
 
 router = APIRouter(tags=["Inventory"])
 
+stock_broadcaster = Broadcaster("inventory", [EventType.STOCK_CHANGED])
+
+
+INVENTORY_PROJECTION = {"_id": 1, "title": 1, "stock": 1, "category_id": 1}
+INVENTORY_SORT = [("title", 1), ("_id", 1)]
+
+
+def inventory_row(product: dict) -> dict:
+    return {
+        "product_id": str(product["_id"]),
+        "title": product["title"],
+        "stock": product.get("stock", 0),
+        "category_id": product.get("category_id")
+    }
+
+
+def stream_inventory(query: dict):
+    products_collection = get_collection("products")
+    products_cursor = products_collection.find(query, INVENTORY_PROJECTION).sort(INVENTORY_SORT).batch_size(1000)
+    for product in products_cursor:
+        yield json.dumps(inventory_row(product)) + "\n"
+
 
 @router.get("", response_model=InventoryListResponse)
-async def get_inventory(current_user: dict = Depends(require_admin)):
+async def get_inventory(
+    limit: int = Query(100, ge=1, le=500, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    max_stock: Optional[int] = Query(None, ge=0, description="Only items with stock at or below this level"),
+    category_id: Optional[str] = Query(None, description="Filter by category"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams every matching item"),
+    current_user: dict = Depends(require_admin)
+):
     products_collection = get_collection("products")
     
-    products_cursor = products_collection.find(
-        {},
-        {"_id": 1, "title": 1, "stock": 1, "category_id": 1}
-    ).sort("title", 1)
+    query = {}
+    if category_id:
+        query["category_id"] = category_id
+    if max_stock is not None:
+        query["stock"] = {"$lte": max_stock}
     
-    items = []
-    for product in products_cursor:
-        items.append(InventoryItem(
-            product_id=str(product["_id"]),
-            title=product["title"],
-            stock=product.get("stock", 0),
-            category_id=product.get("category_id")
-        ))
+    total = products_collection.count_documents(query) if cursor is None and format == "json" else None
+    
+    if cursor:
+        try:
+            title, last_id = decode_cursor(cursor)
+            last_id = ObjectId(last_id)
+        except (ValueError, TypeError, InvalidId):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = {"$and": [query, after_key(["title", "_id"], [title, last_id])]}
+    
+    if format == "ndjson":
+        return StreamingResponse(stream_inventory(query), media_type="application/x-ndjson")
+    
+    products = list(
+        products_collection.find(query, INVENTORY_PROJECTION).sort(INVENTORY_SORT).limit(limit + 1)
+    )
+    
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor([last["title"], str(last["_id"])])
     
     return InventoryListResponse(
-        items=items,
-        total=len(items)
+        items=[InventoryItem(**inventory_row(product)) for product in products],
+        total=total,
+        limit=limit,
+        next_cursor=next_cursor
     )
 
 
+@router.get("/events")
+async def stream_stock_events(
+    request: Request,
+    current_user: dict = Depends(require_admin_stream)
+):
+    return stock_broadcaster.response(request)
+
+
 @router.patch("/{product_id}", response_model=InventoryItem)
 async def update_stock(
     product_id: str,
@@ -47,37 +128,430 @@ async def update_stock(
             detail="Invalid product ID format"
         )
     
-    products_collection = get_collection("products")
+    change = adjust_stock(
+        object_id,
+        stock=stock_data.stock,
+        delta=stock_data.delta,
+        reason=stock_data.reason,
+        updated_by=current_user["user_id"]
+    )
+    
+    return InventoryItem(
+        product_id=product_id,
+        title=change["title"],
+        stock=change["new_stock"],
+        category_id=change["category_id"]
+    )
+
+
+def parse_bulk_csv(body: bytes) -> list:
+    try:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # Blank cells mean "not given", so a row can carry stock or delta.
+        return [
+            {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in reader
+        ]
+    except (UnicodeDecodeError, csv.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid CSV body"
+        )
+
+
+@router.post("/bulk", response_model=BulkStockResponse)
+async def bulk_update_stock(
+    request: Request,
+    current_user: dict = Depends(require_admin)
+):
+    """Apply many stock changes from JSON ``{"items": [...]}`` or a CSV body
+    with ``product_id,stock,delta,reason`` columns."""
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("text/csv"):
+        raw_rows = parse_bulk_csv(body)
+    else:
+        try:
+            raw_rows = BulkStockRequest.model_validate_json(body).items
+        except ValidationError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Body must be {\"items\": [...]} or text/csv"
+            )
+    
+    if len(raw_rows) > settings.INVENTORY_BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.INVENTORY_BULK_MAX_ROWS} rows per request"
+        )
+    
+    results = []
+    rows = []
+    for index, raw_row in enumerate(raw_rows):
+        try:
+            row = BulkStockRow.model_validate(raw_row)
+            object_id = ObjectId(row.product_id)
+        except (ValidationError, InvalidId, TypeError) as exc:
+            raw_product_id = raw_row.get("product_id")
+            results.append({
+                "row": index,
+                "product_id": raw_product_id if isinstance(raw_product_id, str) else None,
+                "status": "invalid",
+                "error": exc.errors()[0]["msg"] if isinstance(exc, ValidationError) else str(exc)
+            })
+            continue
+        rows.append({
+            "row": index,
+            "product_id": object_id,
+            "stock": row.stock,
+            "delta": row.delta,
+            "reason": row.reason
+        })
+    
+    bulk_adjust_stock(rows, updated_by=current_user["user_id"])
+    
+    results.extend({**row, "product_id": str(row["product_id"])} for row in rows)
+    results.sort(key=lambda result: result["row"])
+    updated = sum(1 for result in results if result["status"] == "updated")
+    
+    return BulkStockResponse(
+        results=[BulkStockResult(**result) for result in results],
+        updated=updated,
+        failed=len(results) - updated
+    )
+
+
+def parse_product_id(product_id: str) -> ObjectId:
+    try:
+        return ObjectId(product_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid product ID format"
+        )
+
+
+def time_range_query(field: str, since: Optional[datetime], until: Optional[datetime]) -> dict:
+    time_range = {}
+    if since:
+        time_range["$gte"] = since
+    if until:
+        time_range["$lt"] = until
+    return {field: time_range} if time_range else {}
+
+
+@router.get("/{product_id}/history", response_model=StockHistoryListResponse)
+async def get_stock_history(
+    product_id: str,
+    since: Optional[datetime] = Query(None, description="Inclusive start (UTC)"),
+    until: Optional[datetime] = Query(None, description="Exclusive end (UTC)"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(require_admin)
+):
+    parse_product_id(product_id)
     stock_history_collection = get_collection("stock_history")
     
-    product = products_collection.find_one({"_id": object_id})
-    if not product:
+    query = {"product_id": product_id, **time_range_query("created_at", since, until)}
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+            last_id = ObjectId(last_id)
+        except (ValueError, TypeError, InvalidId):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = {"$and": [query, after_key(["created_at", "_id"], [created_at, last_id], descending=True)]}
+    
+    entries = list(
+        stock_history_collection.find(query)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor([entries[-1]["created_at"], str(entries[-1]["_id"])])
+    
+    return StockHistoryListResponse(
+        entries=[
+            StockHistoryEntry(id=str(entry.pop("_id")), **entry)
+            for entry in entries
+        ],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/{product_id}/history/daily", response_model=DailyStockRollupListResponse)
+async def get_daily_stock_history(
+    product_id: str,
+    since: Optional[datetime] = Query(None, description="Inclusive start day (UTC)"),
+    until: Optional[datetime] = Query(None, description="Exclusive end day (UTC)"),
+    current_user: dict = Depends(require_admin)
+):
+    """Daily rollups for complete days; the current day is not included."""
+    parse_product_id(product_id)
+    daily_collection = get_collection("stock_history_daily")
+    
+    query = {"product_id": product_id, **time_range_query("day", since, until)}
+    days = daily_collection.find(query, {"_id": 0}).sort("day", 1)
+    
+    return DailyStockRollupListResponse(days=[DailyStockRollup(**day) for day in days])
+
+
+@router.get("/alerts", response_model=StockAlertListResponse)
+async def get_alerts(
+    alert_status: Literal["open", "acknowledged", "resolved"] = Query("open", alias="status"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    current_user: dict = Depends(require_admin)
+):
+    alerts_collection = get_collection(ALERTS_COLLECTION)
+    
+    query = {"status": alert_status}
+    if cursor:
+        try:
+            opened_at, last_id = decode_cursor(cursor)
+            last_id = ObjectId(last_id)
+        except (ValueError, TypeError, InvalidId):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = {"$and": [query, after_key(["opened_at", "_id"], [opened_at, last_id], descending=True)]}
+    
+    alerts = list(
+        alerts_collection.find(query, {"active": 0})
+        .sort([("opened_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    
+    next_cursor = None
+    if len(alerts) > limit:
+        alerts = alerts[:limit]
+        next_cursor = encode_cursor([alerts[-1]["opened_at"], str(alerts[-1]["_id"])])
+    
+    return StockAlertListResponse(
+        alerts=[StockAlert(id=str(alert.pop("_id")), **alert) for alert in alerts],
+        next_cursor=next_cursor
+    )
+
+
+@router.post("/alerts/{alert_id}/acknowledge", response_model=StockAlert)
+async def acknowledge_alert(
+    alert_id: str,
+    current_user: dict = Depends(require_admin)
+):
+    try:
+        object_id = ObjectId(alert_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid alert ID format"
+        )
+    
+    alert = get_collection(ALERTS_COLLECTION).find_one_and_update(
+        {"_id": object_id, "status": "open"},
+        {"$set": {
+            "status": "acknowledged",
+            "acknowledged_by": current_user["user_id"],
+            "updated_at": datetime.utcnow()
+        }},
+        projection={"active": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not alert:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
+            detail="Open alert not found"
         )
     
-    previous_stock = product.get("stock", 0)
-    new_stock = stock_data.stock
+    return StockAlert(id=str(alert.pop("_id")), **alert)
+
+
+@router.get("/alerts/rules", response_model=AlertRuleListResponse)
+async def get_alert_rules(current_user: dict = Depends(require_admin)):
+    rules = get_collection(RULES_COLLECTION).find({}, {"_id": 0, "scope": 1, "target_id": 1, "threshold": 1})
     
-    stock_history_collection.insert_one({
-        "product_id": product_id,
-        "previous_stock": previous_stock,
-        "new_stock": new_stock,
-        "change": new_stock - previous_stock,
-        "reason": stock_data.reason,
-        "updated_by": current_user["user_id"],
-        "created_at": datetime.utcnow()
-    })
+    return AlertRuleListResponse(
+        rules=[AlertRule(**rule) for rule in rules],
+        default_threshold=settings.LOW_STOCK_THRESHOLD
+    )
+
+
+@router.put("/alerts/rules", response_model=AlertRule)
+async def set_alert_rule(
+    rule: AlertRule,
+    current_user: dict = Depends(require_admin)
+):
+    get_collection(RULES_COLLECTION).replace_one(
+        {"_id": rule_id(rule.scope, rule.target_id)},
+        {**rule.model_dump(), "updated_by": current_user["user_id"], "updated_at": datetime.utcnow()},
+        upsert=True
+    )
+    rules_version.bump()
+    
+    return rule
+
+
+@router.delete("/alerts/rules/{scope}/{target_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_alert_rule(
+    scope: Literal["product", "category"],
+    target_id: str,
+    current_user: dict = Depends(require_admin)
+):
+    result = get_collection(RULES_COLLECTION).delete_one({"_id": rule_id(scope, target_id)})
+    
+    if result.deleted_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Alert rule not found"
+        )
     
-    products_collection.update_one(
-        {"_id": object_id},
-        {"$set": {"stock": new_stock}}
+    rules_version.bump()
+    
+    return None
+
+
+def reservation_to_response(reservation: dict) -> ReservationResponse:
+    return ReservationResponse(
+        id=str(reservation["_id"]),
+        user_id=reservation["user_id"],
+        items=[ReservationItem(**item) for item in reservation["items"]],
+        status=reservation["status"],
+        expires_at=reservation["expires_at"],
+        created_at=reservation["created_at"],
+        order_id=reservation.get("order_id")
     )
+
+
+@router.post("/reservations", response_model=ReservationResponse, status_code=status.HTTP_201_CREATED)
+async def reserve_stock(
+    reservation_data: ReservationCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    ttl_seconds = min(
+        reservation_data.ttl_seconds or settings.RESERVATION_TTL_SECONDS,
+        settings.RESERVATION_MAX_TTL_SECONDS
+    )
+    reservation = create_reservation(
+        current_user["user_id"],
+        [(item.product_id, item.quantity) for item in reservation_data.items],
+        ttl_seconds
+    )
+    return reservation_to_response(reservation)
+
+
+@router.get("/reservations/{reservation_id}", response_model=ReservationResponse)
+async def get_reservation(
+    reservation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        object_id = ObjectId(reservation_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid reservation ID format"
+        )
     
-    return InventoryItem(
+    reservation = get_collection(RESERVATIONS_COLLECTION).find_one({"_id": object_id})
+    
+    if not reservation or (
+        current_user["role"] != UserRole.ADMIN.value and reservation["user_id"] != current_user["user_id"]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Reservation not found"
+        )
+    
+    return reservation_to_response(reservation)
+
+
+@router.delete("/reservations/{reservation_id}", response_model=ReservationResponse)
+async def release_reservation(
+    reservation_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    user_id = None if current_user["role"] == UserRole.ADMIN.value else current_user["user_id"]
+    return reservation_to_response(cancel_reservation(reservation_id, user_id))
+
+
+@router.get("/{product_id}/availability", response_model=ProductAvailability)
+async def get_availability(product_id: str):
+    product = get_collection("products").find_one(
+        {"_id": parse_product_id(product_id)},
+        {"stock": 1, "reserved": 1}
+    )
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    return ProductAvailability(
+        product_id=product_id,
+        stock=product.get("stock", 0),
+        reserved=product.get("reserved", 0),
+        available=available_stock(product)
+    )
+
+
+def shards_to_response(product_id: str, stock: int, shards: Optional[int]) -> StockShardsResponse:
+    levels = [shard["stock"] for shard in shard_levels(product_id)] if shards else []
+    return StockShardsResponse(
         product_id=product_id,
-        title=product["title"],
-        stock=new_stock,
-        category_id=product.get("category_id")
+        shards=shards,
+        stock=sum(levels) if shards else stock,
+        shard_levels=levels
+    )
+
+
+@router.get("/{product_id}/shards", response_model=StockShardsResponse)
+async def get_stock_shards(
+    product_id: str,
+    current_user: dict = Depends(require_admin)
+):
+    product = get_collection("products").find_one(
+        {"_id": parse_product_id(product_id)},
+        {"stock": 1, "sharded_stock": 1}
     )
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    return shards_to_response(product_id, product.get("stock", 0), product.get("sharded_stock"))
+
+
+@router.put("/{product_id}/shards", response_model=StockShardsResponse)
+async def shard_stock(
+    product_id: str,
+    sharding: StockShardingUpdate,
+    current_user: dict = Depends(require_admin)
+):
+    if sharding.shards > settings.STOCK_SHARDS_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.STOCK_SHARDS_MAX} shards"
+        )
+    
+    product = enable_sharding(parse_product_id(product_id), sharding.shards)
+    return shards_to_response(product_id, product.get("stock", 0), product["sharded_stock"])
+
+
+@router.delete("/{product_id}/shards", response_model=StockShardsResponse)
+async def unshard_stock(
+    product_id: str,
+    current_user: dict = Depends(require_admin)
+):
+    change = disable_sharding(parse_product_id(product_id))
+    # The fold can differ from the level the reconciler last published.
+    if change["new_stock"] != change["previous_stock"]:
+        record_stock_changes([change], history=False)
+    return shards_to_response(product_id, change["new_stock"], None)
@@ -0,0 +1,64 @@
+from bson import ObjectId
+from pymongo import UpdateOne
+from common.catalog_changes import versioned
+from common.database import get_collection
+from common.stock import record_stock_changes
+from common.stock_shards import SHARDED_FILTER, SHARDS_COLLECTION, shard_stats
+
+
+def reconcile_sharded_stock() -> None:
+    """Refresh ``products.stock`` for sharded products from their shard totals.
+
+    Changed levels go through record_stock_changes (without history rows;
+    those are written where the stock was moved), so category counts,
+    alerts and event streams see sharded products like any other. Only
+    the writes that still matched the level read are recorded.
+    """
+    totals = {
+        row["_id"]: row["stock"]
+        for row in get_collection(SHARDS_COLLECTION).aggregate([
+            {"$group": {"_id": "$product_id", "stock": {"$sum": "$stock"}}}
+        ])
+    }
+
+    products_collection = get_collection("products")
+    shard_counts = {}
+    # Every write carries the same token, so the ones that matched can be
+    # found again whatever has changed those products since.
+    write_token = ObjectId()
+    updates = []
+    changes = {}
+    for product in products_collection.find(
+        SHARDED_FILTER,
+        {"title": 1, "stock": 1, "category_id": 1, "sharded_stock": 1}
+    ):
+        product_id = str(product["_id"])
+        shard_counts[product_id] = product["sharded_stock"]
+        new_stock = totals.get(product_id, 0)
+        previous_stock = product.get("stock", 0)
+        if new_stock == previous_stock:
+            continue
+        updates.append(UpdateOne(
+            {"_id": product["_id"], "stock": previous_stock, **SHARDED_FILTER},
+            versioned({"$set": {"stock": new_stock, "stock_write": write_token}})
+        ))
+        changes[product["_id"]] = {
+            "product_id": product_id,
+            "title": product.get("title"),
+            "category_id": product.get("category_id"),
+            "previous_stock": previous_stock,
+            "new_stock": new_stock
+        }
+    shard_stats.shard_counts = shard_counts
+
+    if not updates:
+        return
+    result = products_collection.bulk_write(updates, ordered=False)
+    if result.matched_count < len(updates):
+        # A concurrent write moved the level; the next run picks it up.
+        written = {
+            product["_id"]
+            for product in products_collection.find({"_id": {"$in": list(changes)}, "stock_write": write_token}, {"_id": 1})
+        }
+        changes = {object_id: change for object_id, change in changes.items() if object_id in written}
+    record_stock_changes(list(changes.values()), history=False)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import List
+
+import numpy as np
+
+from app.models import OrderStatus
+from app.snapshot import STATUSES, OrderSnapshot, epoch_seconds
+
+CANCELLED_CODE = STATUSES.index(OrderStatus.CANCELLED.value)
+
+# Orders with at least this many units share the last histogram bucket.
+BASKET_HISTOGRAM_MAX = 20
+
+
+def order_mask(snapshot: OrderSnapshot, since: datetime, until: datetime, include_cancelled: bool = False) -> np.ndarray:
+    """Boolean mask over the order columns for orders created in [since, until)."""
+    created = snapshot["order_created"]
+    mask = (created >= epoch_seconds(since)) & (created < epoch_seconds(until))
+    if not include_cancelled:
+        mask &= snapshot["order_status"] != CANCELLED_CODE
+    return mask
+
+
+def basket_sizes(snapshot: OrderSnapshot, mask: np.ndarray) -> dict:
+    units = snapshot["order_units"][mask]
+    totals = snapshot["order_total"][mask]
+    if not len(units):
+        return {"orders": 0, "mean_units": 0.0, "median_units": 0.0, "p90_units": 0.0, "mean_total": 0.0, "histogram": []}
+
+    histogram = np.bincount(np.minimum(units, BASKET_HISTOGRAM_MAX))
+    median, p90 = np.percentile(units, [50, 90])
+    return {
+        "orders": int(len(units)),
+        "mean_units": round(float(units.mean()), 2),
+        "median_units": float(median),
+        "p90_units": float(p90),
+        "mean_total": round(float(totals.mean()), 2),
+        "histogram": [
+            {"units": size, "orders": int(count)}
+            for size, count in enumerate(histogram)
+            if count
+        ]
+    }
+
+
+def hourly_demand(snapshot: OrderSnapshot, mask: np.ndarray) -> List[dict]:
+    """Orders, units and revenue by hour of day (UTC)."""
+    hours = (snapshot["order_created"][mask] // 3600) % 24
+    orders = np.bincount(hours, minlength=24)
+    units = np.bincount(hours, weights=snapshot["order_units"][mask], minlength=24)
+    revenue = np.bincount(hours, weights=snapshot["order_total"][mask], minlength=24)
+    return [
+        {"hour": hour, "orders": int(orders[hour]), "units": int(units[hour]), "revenue": round(float(revenue[hour]), 2)}
+        for hour in range(24)
+    ]
+
+
+def tax_by_category(snapshot: OrderSnapshot, mask: np.ndarray) -> List[dict]:
+    """Tax, revenue and units per product category, largest tax first."""
+    item_mask = mask[snapshot["item_order"]]
+    # Shift by one so uncategorised items (-1) land in bucket 0.
+    buckets = snapshot["item_category"][item_mask] + 1
+    quantity = snapshot["item_quantity"][item_mask]
+    size = len(snapshot.categories) + 1
+    tax = np.bincount(buckets, weights=snapshot["item_tax"][item_mask], minlength=size)
+    revenue = np.bincount(buckets, weights=snapshot["item_price"][item_mask] * quantity, minlength=size)
+    units = np.bincount(buckets, weights=quantity, minlength=size)
+
+    rows = [
+        {
+            "category_id": snapshot.categories[bucket - 1] if bucket else None,
+            "tax": round(float(tax[bucket]), 2),
+            "revenue": round(float(revenue[bucket]), 2),
+            "units": int(units[bucket])
+        }
+        for bucket in np.flatnonzero(units).tolist()
+    ]
+    rows.sort(key=lambda row: row["tax"], reverse=True)
+    return rows
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from app.models import OrderStatus
+from common.config import settings
+from common.database import get_collection
+
+ARCHIVE_COLLECTION = "orders_archive"
+
+# Orders in these statuses never change again, so they can move to cold storage.
+ARCHIVABLE_STATUSES = [OrderStatus.DELIVERED.value, OrderStatus.CANCELLED.value]
+
+
+def find_order(object_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    """Look an order up in the hot collection, then in the archive."""
+    order = get_collection("orders").find_one({"_id": object_id}, projection)
+    if order is None:
+        order = get_collection(ARCHIVE_COLLECTION).find_one({"_id": object_id}, projection)
+    return order
+
+
+def newest_with_archive(match: dict, skip: int, limit: int) -> list:
+    """Pipeline for one newest-first page of hot and archived orders.
+
+    Each side is cut to its first ``skip + limit`` orders on its
+    ``created_at`` index before the union, so only those are merged and
+    re-sorted rather than every matching order.
+    """
+    newest = [{"$match": match}, {"$sort": {"created_at": -1}}, {"$limit": skip + limit}]
+    return [
+        *newest,
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": newest}},
+        {"$sort": {"created_at": -1}},
+        {"$skip": skip},
+        {"$limit": limit}
+    ]
+
+
+def archive_orders() -> int:
+    """Move terminal orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive.
+
+    Each batch is copied with idempotent upserts before it is deleted from
+    the hot collection, so a crash in between only leaves a duplicate that
+    the next run overwrites and removes.
+    """
+    orders_collection = get_collection("orders")
+    archive_collection = get_collection(ARCHIVE_COLLECTION)
+    cutoff = datetime.utcnow() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    query = {"status": {"$in": ARCHIVABLE_STATUSES}, "created_at": {"$lt": cutoff}}
+
+    archived = 0
+    while True:
+        batch = list(orders_collection.find(query).sort("created_at", 1).limit(settings.ORDER_ARCHIVE_BATCH_SIZE))
+        if not batch:
+            break
+        archive_collection.bulk_write(
+            [ReplaceOne({"_id": order["_id"]}, {**order, "archived_at": datetime.utcnow()}, upsert=True) for order in batch],
+            ordered=False
+        )
+        orders_collection.delete_many({"_id": {"$in": [order["_id"] for order in batch]}, **query})
+        archived += len(batch)
+        if len(batch) < settings.ORDER_ARCHIVE_BATCH_SIZE:
+            break
+    return archived
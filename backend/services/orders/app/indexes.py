@@ -0,0 +1,27 @@
+from common.database import get_collection
+from common.idempotency import ensure_idempotency_indexes
+
+
+def ensure_indexes():
+    ensure_idempotency_indexes()
+
+    orders_collection = get_collection("orders")
+    # Order listings: a customer's own orders, and the admin's full list.
+    orders_collection.create_index([("user_id", 1), ("created_at", -1)], name="orders_user_created")
+    orders_collection.create_index([("created_at", -1)], name="orders_created")
+    # The archiver's scan for old terminal orders.
+    orders_collection.create_index([("status", 1), ("created_at", 1)], name="orders_status_created")
+
+    archive_collection = get_collection("orders_archive")
+    archive_collection.create_index([("user_id", 1), ("created_at", -1)], name="archive_user_created")
+    archive_collection.create_index([("created_at", -1)], name="archive_created")
+
+    get_collection("sales_daily").create_index("day", name="sales_day")
+    get_collection("sales_product_daily").create_index([("day", 1), ("product_id", 1)], name="sales_product_day")
+
+    queue_collection = get_collection("order_queue")
+    # Workers claim oldest-first by status; lapsed locks are found by expiry.
+    queue_collection.create_index([("status", 1), ("_id", 1)], name="queue_status_id")
+    queue_collection.create_index([("status", 1), ("locked_until", 1)], name="queue_status_lock")
+    # Finished entries are kept a week for status polling and support.
+    queue_collection.create_index("finished_at", name="queue_finished_ttl", expireAfterSeconds=7 * 86400)
@@ -2,15 +2,46 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
+from common.events import start_event_listener, stop_event_listener
 from common.config import settings
+from common.background import PeriodicTask
+from common.metrics import collect_metrics
 from common.errors import setup_exception_handlers
 from app.routes import router
+from app.indexes import ensure_indexes
+from app.queue import start_order_queue, stop_order_queue
+from app.archive import archive_orders
+from app.snapshot import load_snapshot, refresh_order_snapshot, start_order_snapshot
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    ensure_indexes()
+    start_event_listener()
+    start_order_queue()
+    archive_task = PeriodicTask(
+        "order_archive",
+        settings.ORDER_ARCHIVE_INTERVAL_SECONDS,
+        archive_orders,
+        singleton=True
+    )
+    archive_task.start()
+    # The snapshot is on local disk, so every replica builds its own; the
+    # first build starts now rather than an interval after startup.
+    snapshot_task = PeriodicTask(
+        "order_snapshot",
+        settings.ORDER_SNAPSHOT_INTERVAL_SECONDS,
+        refresh_order_snapshot
+    )
+    snapshot_task.start()
+    if load_snapshot() is None:
+        start_order_snapshot()
     yield
+    snapshot_task.stop()
+    archive_task.stop()
+    stop_order_queue()
+    stop_event_listener()
     close_mongo_connection()
 
 
@@ -37,4 +68,9 @@ async def health_check():
     return {"status": "healthy", "service": "orders"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/orders")
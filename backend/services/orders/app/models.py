@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -13,6 +13,17 @@ class OrderStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+# Statuses an order may move to from each status.
+ORDER_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.PROCESSING, OrderStatus.CANCELLED},
+    OrderStatus.PROCESSING: {OrderStatus.SHIPPED, OrderStatus.CANCELLED},
+    OrderStatus.SHIPPED: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+    OrderStatus.CANCELLED: set()
+}
+
+
 class OrderItem(BaseModel):
     product_id: str
     title: str
@@ -29,6 +40,35 @@ class OrderItemCreate(BaseModel):
 class OrderCreate(BaseModel):
     items: List[OrderItemCreate] = Field(..., min_length=1)
     shipping_address: Optional[str] = None
+    # Stock held at checkout start via POST /api/inventory/reservations.
+    reservation_id: Optional[str] = None
+
+
+class CheckoutRequest(BaseModel):
+    shipping_address: Optional[str] = None
+    reservation_id: Optional[str] = None
+
+
+class OrderStatusUpdate(BaseModel):
+    status: OrderStatus
+
+
+class BulkOrderStatusUpdate(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1)
+    status: OrderStatus
+
+
+class BulkOrderStatusResult(BaseModel):
+    order_id: str
+    status: Literal["updated", "invalid", "not_found", "invalid_transition", "conflict"]
+    previous_status: Optional[OrderStatus] = None
+    error: Optional[str] = None
+
+
+class BulkOrderStatusResponse(BaseModel):
+    results: List[BulkOrderStatusResult]
+    updated: int
+    failed: int
 
 
 class OrderResponse(BaseModel):
@@ -52,3 +92,106 @@ class OrderListResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+
+
+class OrderSummary(BaseModel):
+    id: str
+    order_number: Optional[str] = None
+    user_id: str
+    status: OrderStatus
+    total: float
+    item_count: int
+    created_at: datetime
+
+
+class OrderSummaryListResponse(BaseModel):
+    orders: List[OrderSummary]
+    total: int
+    page: int
+    limit: int
+    total_pages: int
+
+
+class OrderQueueStatus(BaseModel):
+    id: str
+    status: Literal["queued", "processing", "completed", "failed"]
+    # Set once completed; the same id as the queue entry.
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+
+class DailySales(BaseModel):
+    day: datetime
+    orders: int = 0
+    revenue: float = 0
+    subtotal: float = 0
+    tax: float = 0
+    units: int = 0
+    cancelled_orders: int = 0
+    cancelled_revenue: float = 0
+
+
+class DailySalesListResponse(BaseModel):
+    days: List[DailySales]
+
+
+class ProductSales(BaseModel):
+    product_id: str
+    title: Optional[str] = None
+    units: int
+    revenue: float
+
+
+class TopProductsResponse(BaseModel):
+    products: List[ProductSales]
+    since: datetime
+    until: datetime
+
+
+class BasketSizeBucket(BaseModel):
+    units: int
+    orders: int
+
+
+class BasketSizeReport(BaseModel):
+    orders: int
+    mean_units: float
+    median_units: float
+    p90_units: float
+    mean_total: float
+    # The last bucket counts every order with at least that many units.
+    histogram: List[BasketSizeBucket]
+    since: datetime
+    until: datetime
+    snapshot_at: datetime
+
+
+class HourlyDemand(BaseModel):
+    hour: int
+    orders: int
+    units: int
+    revenue: float
+
+
+class HourlyDemandReport(BaseModel):
+    hours: List[HourlyDemand]
+    since: datetime
+    until: datetime
+    snapshot_at: datetime
+
+
+class CategoryTax(BaseModel):
+    category_id: Optional[str] = None
+    tax: float
+    revenue: float
+    units: int
+
+
+class CategoryTaxReport(BaseModel):
+    categories: List[CategoryTax]
+    since: datetime
+    until: datetime
+    snapshot_at: datetime
@@ -0,0 +1,275 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+import uuid
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from app.models import CheckoutRequest, OrderCreate, OrderItemCreate, OrderStatus
+from app.sales import record_order_sales
+from common.database import get_collection
+from common.catalog_changes import versioned
+from common.category_stats import apply_product_changes, stock_change
+from common.events import EventType, publish_many
+from common.stock import record_stock_changes
+from common.reservations import RESERVATIONS_COLLECTION, available_filter, claim_reservation, release_quantities
+from common.stock_shards import UNSHARDED_FILTER, return_stock, take_stock
+
+ORDER_PRODUCT_PROJECTION = {"title": 1, "price": 1, "tax_percent": 1, "sharded_stock": 1}
+
+
+def place_order(order_data: OrderCreate, user_id: str, order_id: Optional[ObjectId] = None) -> dict:
+    """Take stock for every item, insert the order and return its document.
+
+    Raises HTTPException for bad or unavailable items. Whatever fails, stock
+    already taken is put back before the error propagates. ``order_id`` fixes the new order's ``_id``, as
+    the intake queue does so a retried entry can't create a second order.
+    """
+    products_collection = get_collection("products")
+    orders_collection = get_collection("orders")
+    
+    order_items = []
+    stock_events = []
+    stock_changes = []
+    subtotal = 0.0
+    tax_total = 0.0
+    
+    product_ids = []
+    for item in order_data.items:
+        try:
+            product_ids.append(ObjectId(item.product_id))
+        except InvalidId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid product ID: {item.product_id}"
+            )
+    
+    # Every item is priced from one $in read.
+    products = {
+        product["_id"]: product
+        for product in products_collection.find({"_id": {"$in": product_ids}}, ORDER_PRODUCT_PROJECTION)
+    }
+    
+    # Quantities held for this user; whatever the order doesn't use is
+    # handed back below.
+    held = {}
+    if order_data.reservation_id:
+        held = claim_reservation(order_data.reservation_id, user_id)
+    applied = []
+    
+    try:
+        for item, product_id in zip(order_data.items, product_ids):
+            product = products.get(product_id)
+            if not product:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Product not found: {item.product_id}"
+                )
+            
+            # Held units are already counted in `reserved`; the rest must come
+            # out of unreserved stock. Both are settled in the same update.
+            held_quantity = min(held.get(item.product_id, 0), item.quantity)
+            shards = product.get("sharded_stock")
+            if shards:
+                # Flash-sale products take from a stock shard instead of the
+                # product document; the stock view and its events follow
+                # from the inventory service's reconciler.
+                if not take_stock(item.product_id, item.quantity, shards, held=held_quantity):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Insufficient stock for product: {product['title']}"
+                    )
+                if held_quantity:
+                    products_collection.update_one({"_id": product_id}, {"$inc": {"reserved": -held_quantity}})
+            else:
+                updated_product = products_collection.find_one_and_update(
+                    {"_id": product_id, **UNSHARDED_FILTER, **available_filter(item.quantity - held_quantity)},
+                    versioned({"$inc": {"stock": -item.quantity, "reserved": -held_quantity}}),
+                    projection={"stock": 1, "category_id": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if updated_product is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Insufficient stock for product: {product['title']}"
+                    )
+            held[item.product_id] = held.get(item.product_id, 0) - held_quantity
+            applied.append((product_id, item.quantity, shards))
+            
+            item_subtotal = product["price"] * item.quantity
+            item_tax = item_subtotal * (product.get("tax_percent", 0) / 100)
+            
+            order_items.append({
+                "product_id": item.product_id,
+                "title": product["title"],
+                "price": product["price"],
+                "quantity": item.quantity,
+                "tax_percent": product.get("tax_percent", 0)
+            })
+            
+            subtotal += item_subtotal
+            tax_total += item_tax
+            
+            if shards:
+                continue
+            stock_events.append((EventType.STOCK_CHANGED, item.product_id, {
+                "previous_stock": updated_product["stock"] + item.quantity,
+                "new_stock": updated_product["stock"],
+                "category_id": updated_product.get("category_id"),
+                "title": product["title"]
+            }))
+            stock_changes.append(stock_change(
+                updated_product.get("category_id"),
+                updated_product["stock"] + item.quantity,
+                updated_product["stock"]
+            ))
+        
+        # Generate unique order number
+        order_number = f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+        
+        order_dict = {
+            "orderNumber": order_number,
+            "user_id": user_id,
+            "items": order_items,
+            "subtotal": round(subtotal, 2),
+            "tax_total": round(tax_total, 2),
+            "total": round(subtotal + tax_total, 2),
+            "status": OrderStatus.PENDING.value,
+            "shipping_address": order_data.shipping_address,
+            "created_at": datetime.utcnow()
+        }
+        if order_id is not None:
+            order_dict["_id"] = order_id
+        
+        # insert_one fills in _id, so the inserted document is the response.
+        result = orders_collection.insert_one(order_dict)
+    except Exception:
+        # Put back what this order already took, whatever failed (including
+        # the insert); the reservation is spent, so its held units return to
+        # the pool rather than to the hold.
+        for product_id, quantity, shards in applied:
+            if shards:
+                return_stock(str(product_id), quantity, shards)
+            else:
+                products_collection.update_one({"_id": product_id}, versioned({"$inc": {"stock": quantity}}))
+        release_quantities(held)
+        raise
+    
+    release_quantities(held)
+    
+    if order_data.reservation_id:
+        get_collection(RESERVATIONS_COLLECTION).update_one(
+            {"_id": ObjectId(order_data.reservation_id)},
+            {"$set": {"order_id": str(result.inserted_id)}}
+        )
+    
+    apply_product_changes(stock_changes)
+    record_order_sales(order_dict)
+    publish_many(stock_events + [(EventType.ORDER_CREATED, str(result.inserted_id), {
+        "order_number": order_number,
+        "user_id": order_dict["user_id"],
+        "total": order_dict["total"],
+        "items": len(order_items),
+        "status": order_dict["status"]
+    })])
+    
+    return order_dict
+
+
+def restock_cancelled_orders(orders: List[dict]) -> None:
+    """Put the units of just-cancelled orders back on sale.
+
+    Callers restock only orders their own status write moved to cancelled,
+    so each order is returned once. Held units were settled when the order
+    was placed, so there is nothing left reserved to release.
+    """
+    quantities = defaultdict(int)
+    for order in orders:
+        for item in order["items"]:
+            quantities[item["product_id"]] += item["quantity"]
+    
+    products_collection = get_collection("products")
+    changes = []
+    for product_id, quantity in quantities.items():
+        try:
+            object_id = ObjectId(product_id)
+        except InvalidId:
+            continue
+        updated_product = products_collection.find_one_and_update(
+            {"_id": object_id, **UNSHARDED_FILTER},
+            versioned({"$inc": {"stock": quantity}}),
+            projection={"title": 1, "stock": 1, "category_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated_product is None:
+            product = products_collection.find_one({"_id": object_id}, {"sharded_stock": 1})
+            if product and product.get("sharded_stock"):
+                return_stock(product_id, quantity, product["sharded_stock"])
+            continue
+        changes.append({
+            "product_id": product_id,
+            "title": updated_product["title"],
+            "category_id": updated_product.get("category_id"),
+            "previous_stock": updated_product["stock"] - quantity,
+            "new_stock": updated_product["stock"]
+        })
+    # Like the decrements at placement, no history rows.
+    record_stock_changes(changes, history=False)
+
+
+def checkout_cart(user_id: str, checkout_data: CheckoutRequest) -> dict:
+    """Place an order for everything in the user's cart, then take it out of the cart.
+
+    The cart is updated after the order is inserted, not atomically with
+    it: the ordered quantities are subtracted from their lines, so units
+    added while the order was being placed stay in the cart.
+    """
+    users_collection = get_collection("users")
+    user = users_collection.find_one({"_id": ObjectId(user_id)}, {"cart": 1})
+    cart = (user or {}).get("cart") or []
+    if not cart:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cart is empty"
+        )
+    
+    quantities = {}
+    for cart_item in cart:
+        quantities[cart_item["product_id"]] = quantities.get(cart_item["product_id"], 0) + cart_item.get("quantity", 1)
+    
+    order = place_order(
+        OrderCreate(
+            items=[OrderItemCreate(product_id=product_id, quantity=quantity) for product_id, quantity in quantities.items()],
+            shipping_address=checkout_data.shipping_address,
+            reservation_id=checkout_data.reservation_id
+        ),
+        user_id
+    )
+    
+    remove_ordered_from_cart(user["_id"], quantities)
+    
+    return order
+
+
+def remove_ordered_from_cart(user_id: ObjectId, quantities: dict) -> None:
+    """Subtract ordered quantities from the cart in one update, dropping lines that reach zero."""
+    ordered = {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$$line.product_id", product_id]}, "then": quantity}
+            for product_id, quantity in quantities.items()
+        ],
+        "default": 0
+    }}
+    remaining = {"$map": {
+        "input": {"$ifNull": ["$cart", []]},
+        "as": "line",
+        "in": {"$mergeObjects": [
+            "$$line",
+            {"quantity": {"$subtract": [{"$ifNull": ["$$line.quantity", 1]}, ordered]}}
+        ]}
+    }}
+    get_collection("users").update_one(
+        {"_id": user_id},
+        [{"$set": {"cart": {"$filter": {"input": remaining, "as": "line", "cond": {"$gt": ["$$line.quantity", 0]}}}}}]
+    )
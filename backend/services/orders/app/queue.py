@@ -0,0 +1,216 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.models import OrderCreate
+from app.placement import place_order
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+QUEUE_COLLECTION = "order_queue"
+
+# Seconds a client is told to wait when the queue is full.
+QUEUE_FULL_RETRY_AFTER = 5
+
+
+def enqueue_order(order_data: OrderCreate, user_id: str) -> dict:
+    """Accept an order for background placement and return its queue entry.
+
+    The entry's ``_id`` becomes the order's ``_id``, so a client can poll
+    for it and a retried entry can't place the order twice.
+    """
+    queue_collection = get_collection(QUEUE_COLLECTION)
+    # Bounded count on an indexed field: the cost of checking back-pressure
+    # doesn't grow with the backlog.
+    depth = queue_collection.count_documents({"status": "queued"}, limit=settings.ORDER_QUEUE_MAX_DEPTH)
+    if depth >= settings.ORDER_QUEUE_MAX_DEPTH:
+        _stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Order queue is full, please retry shortly",
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)}
+        )
+
+    now = datetime.utcnow()
+    entry = {
+        "user_id": user_id,
+        "request": order_data.model_dump(),
+        "status": "queued",
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now
+    }
+    queue_collection.insert_one(entry)
+    _stats["enqueued"] += 1
+    if _workers:
+        _workers.wake()
+    return entry
+
+
+def claim_batch(worker_id: str, size: int) -> List[dict]:
+    """Claim up to ``size`` entries, oldest first, including ones whose worker died."""
+    queue_collection = get_collection(QUEUE_COLLECTION)
+    now = datetime.utcnow()
+    batch = []
+    for _ in range(size):
+        entry = queue_collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "processing", "locked_until": {"$lte": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "processing",
+                    "worker": worker_id,
+                    "locked_until": now + timedelta(seconds=settings.ORDER_QUEUE_LOCK_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("_id", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if entry is None:
+            break
+        batch.append(entry)
+    return batch
+
+
+def _finish(entry: dict, fields: dict) -> UpdateOne:
+    now = datetime.utcnow()
+    return UpdateOne(
+        {"_id": entry["_id"], "worker": entry["worker"]},
+        {"$set": {**fields, "updated_at": now, "finished_at": now}, "$unset": {"locked_until": ""}}
+    )
+
+
+def _retry_or_fail(entry: dict, unset: dict) -> UpdateOne:
+    if entry["attempts"] < settings.ORDER_QUEUE_MAX_ATTEMPTS:
+        _stats["retried"] += 1
+        return UpdateOne(
+            {"_id": entry["_id"], "worker": entry["worker"]},
+            {"$set": {"status": "queued", "updated_at": datetime.utcnow()}, "$unset": {"locked_until": "", "worker": "", **unset}}
+        )
+    _stats["failed"] += 1
+    return _finish(entry, {"status": "failed", "error": "An unexpected error occurred", "error_status": 500})
+
+
+def process_entry(entry: dict) -> UpdateOne:
+    """Place one queued order and return the write that records the outcome.
+
+    Before any stock is touched the attempt claims the entry's ``placing``
+    field, so a second worker that picks the entry up after a lapsed lock
+    can't place it again alongside the first.
+    """
+    order_id = entry["_id"]
+    claimed = get_collection(QUEUE_COLLECTION).update_one(
+        {"_id": order_id, "worker": entry["worker"], "placing": {"$exists": False}},
+        {"$set": {"placing": entry["worker"]}}
+    )
+    if not claimed.modified_count:
+        if get_collection("orders").count_documents({"_id": order_id}, limit=1):
+            # Placed on an earlier attempt whose worker died before recording it.
+            _stats["completed"] += 1
+            return _finish(entry, {"status": "completed", "order_id": str(order_id)})
+        # An earlier attempt is still placing it, or died partway; look again later.
+        return _retry_or_fail(entry, {})
+
+    try:
+        place_order(OrderCreate(**entry["request"]), entry["user_id"], order_id=order_id)
+    except HTTPException as exc:
+        _stats["failed"] += 1
+        return _finish(entry, {"status": "failed", "error": exc.detail, "error_status": exc.status_code})
+    except Exception:
+        # place_order has put back whatever it took, so the claim is released.
+        logger.exception("Queued order %s failed", order_id)
+        return _retry_or_fail(entry, {"placing": ""})
+
+    _stats["completed"] += 1
+    return _finish(entry, {"status": "completed", "order_id": str(order_id)})
+
+
+class OrderQueueWorkers:
+    """A pool of threads that drain the order queue in batches.
+
+    Idle workers poll every ORDER_QUEUE_POLL_MS and are woken early when
+    this process enqueues an order.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self.count):
+            worker_id = f"{uuid.uuid4().hex[:12]}-{index}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"order-queue-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=settings.ORDER_QUEUE_LOCK_SECONDS)
+        self._threads = []
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _run(self, worker_id: str) -> None:
+        queue_collection = get_collection(QUEUE_COLLECTION)
+        poll_interval = settings.ORDER_QUEUE_POLL_MS / 1000
+        while not self._stop.is_set():
+            try:
+                batch = claim_batch(worker_id, settings.ORDER_QUEUE_BATCH_SIZE)
+                if not batch:
+                    self._wakeup.wait(poll_interval)
+                    self._wakeup.clear()
+                    continue
+                _stats["batches"] += 1
+                queue_collection.bulk_write([process_entry(entry) for entry in batch], ordered=False)
+            except PyMongoError:
+                logger.exception("Order queue worker %s failed, retrying", worker_id)
+                self._stop.wait(poll_interval)
+
+
+_workers: Optional[OrderQueueWorkers] = None
+
+_stats = {"enqueued": 0, "rejected": 0, "batches": 0, "completed": 0, "failed": 0, "retried": 0}
+
+
+def start_order_queue() -> None:
+    global _workers
+    if _workers is not None or settings.ORDER_QUEUE_WORKERS <= 0:
+        return
+    _workers = OrderQueueWorkers(settings.ORDER_QUEUE_WORKERS)
+    _workers.start()
+
+
+def stop_order_queue() -> None:
+    global _workers
+    if _workers:
+        _workers.stop()
+        _workers = None
+
+
+def queue_stats() -> dict:
+    return {
+        **_stats,
+        "workers": _workers.count if _workers else 0,
+        "depth": get_collection(QUEUE_COLLECTION).count_documents({"status": "queued"}, limit=settings.ORDER_QUEUE_MAX_DEPTH)
+    }
+
+
+register_collector("order_queue", queue_stats)
@@ -1,15 +1,35 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Request, Response
+from typing import Literal, Optional, Union
+from datetime import datetime, timedelta
 from math import ceil
-import uuid
 from bson import ObjectId
 from bson.errors import InvalidId
-from app.models import OrderCreate, OrderResponse, OrderListResponse, OrderItem, OrderStatus, OrderItemCreate
+from pymongo import ReturnDocument, UpdateOne
+from app.archive import ARCHIVE_COLLECTION, find_order, newest_with_archive
+from app.analytics import basket_sizes, hourly_demand, order_mask, tax_by_category
+from app.placement import checkout_cart, place_order, restock_cancelled_orders
+from app.queue import QUEUE_COLLECTION, enqueue_order
+from app.snapshot import OrderSnapshot, load_snapshot, start_order_snapshot
+from app.sales import (
+    DAILY_COLLECTION, PRODUCT_DAILY_COLLECTION, naive_utc, record_orders_cancelled, start_of_day, start_sales_backfill
+)
+from app.models import (
+    OrderCreate, OrderResponse, OrderListResponse, OrderItem, OrderStatus, OrderItemCreate,
+    OrderStatusUpdate, BulkOrderStatusUpdate, BulkOrderStatusResult, BulkOrderStatusResponse, OrderQueueStatus, CheckoutRequest, OrderSummary, OrderSummaryListResponse,
+    DailySales, DailySalesListResponse, ProductSales, TopProductsResponse, BasketSizeReport, HourlyDemandReport,
+    CategoryTaxReport, ORDER_TRANSITIONS
+)
 from common.database import get_collection
-from common.auth_middleware import get_current_user, UserRole
+from common.config import settings
+from common.auth_middleware import get_current_user, require_admin, require_admin_stream, UserRole
+from common.events import EventType, publish, publish_many
+from common.idempotency import IDEMPOTENCY_HEADER, request_fingerprint, run_idempotent
+from common.sse import Broadcaster
 
 router = APIRouter(tags=["Orders"])
 
+order_broadcaster = Broadcaster("orders", [EventType.ORDER_CREATED, EventType.ORDER_STATUS_CHANGED])
+
 
 def order_to_response(order: dict) -> OrderResponse:
     return OrderResponse(
@@ -25,10 +45,35 @@ def order_to_response(order: dict) -> OrderResponse:
     )
 
 
-@router.get("", response_model=OrderListResponse)
+# Header fields for list views; items are only counted, never sent.
+SUMMARY_PROJECTION = {
+    "orderNumber": 1,
+    "user_id": 1,
+    "status": 1,
+    "total": 1,
+    "created_at": 1,
+    "item_count": {"$size": {"$ifNull": ["$items", []]}}
+}
+
+
+def order_to_summary(order: dict) -> OrderSummary:
+    return OrderSummary(
+        id=str(order["_id"]),
+        order_number=order.get("orderNumber"),
+        user_id=order["user_id"],
+        status=OrderStatus(order["status"]),
+        total=order["total"],
+        item_count=order["item_count"],
+        created_at=order["created_at"]
+    )
+
+
+@router.get("", response_model=Union[OrderListResponse, OrderSummaryListResponse])
 async def get_orders(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    view: Literal["full", "summary"] = Query("full", description="summary returns header fields and an item count"),
+    include_archived: bool = Query(False, description="Also list old delivered and cancelled orders"),
     current_user: dict = Depends(get_current_user)
 ):
     orders_collection = get_collection("orders")
@@ -39,10 +84,30 @@ async def get_orders(
         query = {"user_id": current_user["user_id"]}
     
     total = orders_collection.count_documents(query)
+    if include_archived:
+        total += get_collection(ARCHIVE_COLLECTION).count_documents(query)
     total_pages = ceil(total / limit) if total > 0 else 1
     
     skip = (page - 1) * limit
-    orders_cursor = orders_collection.find(query).skip(skip).limit(limit).sort("created_at", -1)
+    if include_archived:
+        page_stages = newest_with_archive(query, skip, limit)
+    else:
+        page_stages = [{"$match": query}, {"$sort": {"created_at": -1}}, {"$skip": skip}, {"$limit": limit}]
+    
+    if view == "summary":
+        summaries = orders_collection.aggregate(page_stages + [{"$project": SUMMARY_PROJECTION}], allowDiskUse=True)
+        return OrderSummaryListResponse(
+            orders=[order_to_summary(order) for order in summaries],
+            total=total,
+            page=page,
+            limit=limit,
+            total_pages=total_pages
+        )
+    
+    if include_archived:
+        orders_cursor = orders_collection.aggregate(page_stages, allowDiskUse=True)
+    else:
+        orders_cursor = orders_collection.find(query).skip(skip).limit(limit).sort("created_at", -1)
     
     orders = [order_to_response(order) for order in orders_cursor]
     
@@ -55,6 +120,26 @@ async def get_orders(
     )
 
 
+def queue_entry_to_response(entry: dict) -> OrderQueueStatus:
+    return OrderQueueStatus(
+        id=str(entry["_id"]),
+        status=entry["status"],
+        order_id=entry.get("order_id"),
+        error=entry.get("error"),
+        attempts=entry.get("attempts", 0),
+        created_at=entry["created_at"],
+        updated_at=entry["updated_at"]
+    )
+
+
+@router.get("/events")
+async def stream_order_events(
+    request: Request,
+    current_user: dict = Depends(require_admin_stream)
+):
+    return order_broadcaster.response(request)
+
+
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: str,
@@ -68,8 +153,7 @@ async def get_order(
             detail="Invalid order ID format"
         )
     
-    orders_collection = get_collection("orders")
-    order = orders_collection.find_one({"_id": object_id})
+    order = find_order(object_id)
     
     if not order:
         raise HTTPException(
@@ -86,83 +170,360 @@ async def get_order(
     return order_to_response(order)
 
 
-@router.post("", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
+@router.post("", response_model=Union[OrderResponse, OrderQueueStatus], status_code=status.HTTP_201_CREATED)
 async def create_order(
     order_data: OrderCreate,
+    response: Response,
+    mode: Optional[Literal["sync", "async"]] = Query(None, description="async queues the order and returns 202"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: dict = Depends(get_current_user)
 ):
-    products_collection = get_collection("products")
-    orders_collection = get_collection("orders")
+    mode = mode or settings.ORDER_INTAKE_MODE
+    if mode == "async":
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await run_idempotent(
+            idempotency_key,
+            current_user["user_id"],
+            request_fingerprint("create_order", order_data, mode),
+            lambda: queue_entry_to_response(enqueue_order(order_data, current_user["user_id"])),
+            status.HTTP_202_ACCEPTED
+        )
+    
+    return await run_idempotent(
+        idempotency_key,
+        current_user["user_id"],
+        request_fingerprint("create_order", order_data),
+        lambda: order_to_response(place_order(order_data, current_user["user_id"])),
+        status.HTTP_201_CREATED
+    )
+
+
+@router.post("/checkout", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
+async def checkout(
+    checkout_data: Optional[CheckoutRequest] = None,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    current_user: dict = Depends(get_current_user)
+):
+    checkout_data = checkout_data or CheckoutRequest()
+    return await run_idempotent(
+        idempotency_key,
+        current_user["user_id"],
+        request_fingerprint("checkout", checkout_data),
+        lambda: order_to_response(checkout_cart(current_user["user_id"], checkout_data)),
+        status.HTTP_201_CREATED
+    )
+
+
+def report_range(since: Optional[datetime], until: Optional[datetime]) -> tuple:
+    """Default to the last 30 days; ``until`` is exclusive."""
+    until = until or datetime.utcnow()
+    since = since or start_of_day(until) - timedelta(days=29)
+    return since, until
+
+
+@router.get("/reports/daily", response_model=DailySalesListResponse)
+async def get_daily_sales(
+    since: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+    until: Optional[datetime] = Query(None, description="Exclusive; default: now"),
+    current_user: dict = Depends(require_admin)
+):
+    since, until = report_range(since, until)
+    days = get_collection(DAILY_COLLECTION).find(
+        {"day": {"$gte": start_of_day(since), "$lt": until}},
+        {"_id": 0}
+    ).sort("day", 1)
+    
+    return DailySalesListResponse(days=[DailySales(**day) for day in days])
+
+
+@router.get("/reports/top-products", response_model=TopProductsResponse)
+async def get_top_products(
+    since: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+    until: Optional[datetime] = Query(None, description="Exclusive; default: now"),
+    sort: Literal["units", "revenue"] = Query("revenue"),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(require_admin)
+):
+    since, until = report_range(since, until)
+    top = get_collection(PRODUCT_DAILY_COLLECTION).aggregate([
+        {"$match": {"day": {"$gte": start_of_day(since), "$lt": until}}},
+        {"$group": {
+            "_id": "$product_id",
+            "units": {"$sum": "$units"},
+            "revenue": {"$sum": "$revenue"},
+            "title": {"$last": "$title"}
+        }},
+        {"$sort": {sort: -1, "_id": 1}},
+        {"$limit": limit}
+    ])
+    
+    return TopProductsResponse(
+        products=[
+            ProductSales(product_id=row["_id"], title=row.get("title"), units=row["units"], revenue=round(row["revenue"], 2))
+            for row in top
+        ],
+        since=since,
+        until=until
+    )
+
+
+@router.post("/reports/rebuild", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_sales_reports(
+    since: Optional[datetime] = Query(None, description="Default: the first order"),
+    current_user: dict = Depends(require_admin)
+):
+    if not start_sales_backfill(naive_utc(since) if since else None):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A sales rollup rebuild is already running"
+        )
+    return {"status": "started"}
+
+
+def current_snapshot() -> OrderSnapshot:
+    snapshot = load_snapshot()
+    if snapshot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No orders snapshot has been built yet"
+        )
+    return snapshot
+
+
+@router.get("/analytics/basket-sizes", response_model=BasketSizeReport)
+async def get_basket_sizes(
+    since: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+    until: Optional[datetime] = Query(None, description="Exclusive; default: now"),
+    include_cancelled: bool = Query(False),
+    current_user: dict = Depends(require_admin)
+):
+    snapshot = current_snapshot()
+    since, until = report_range(since, until)
+    report = basket_sizes(snapshot, order_mask(snapshot, since, until, include_cancelled))
+    return BasketSizeReport(**report, since=since, until=until, snapshot_at=snapshot.created_at)
+
+
+@router.get("/analytics/hourly-demand", response_model=HourlyDemandReport)
+async def get_hourly_demand(
+    since: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+    until: Optional[datetime] = Query(None, description="Exclusive; default: now"),
+    include_cancelled: bool = Query(False),
+    current_user: dict = Depends(require_admin)
+):
+    snapshot = current_snapshot()
+    since, until = report_range(since, until)
+    hours = hourly_demand(snapshot, order_mask(snapshot, since, until, include_cancelled))
+    return HourlyDemandReport(hours=hours, since=since, until=until, snapshot_at=snapshot.created_at)
+
+
+@router.get("/analytics/tax-by-category", response_model=CategoryTaxReport)
+async def get_tax_by_category(
+    since: Optional[datetime] = Query(None, description="Default: 30 days ago"),
+    until: Optional[datetime] = Query(None, description="Exclusive; default: now"),
+    current_user: dict = Depends(require_admin)
+):
+    snapshot = current_snapshot()
+    since, until = report_range(since, until)
+    categories = tax_by_category(snapshot, order_mask(snapshot, since, until))
+    return CategoryTaxReport(categories=categories, since=since, until=until, snapshot_at=snapshot.created_at)
+
+
+@router.post("/analytics/snapshot", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_orders_snapshot(current_user: dict = Depends(require_admin)):
+    if not start_order_snapshot():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An orders snapshot is already being built"
+        )
+    return {"status": "started"}
+
+
+@router.get("/queue/{entry_id}", response_model=OrderQueueStatus)
+async def get_queued_order(
+    entry_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        object_id = ObjectId(entry_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid queue entry ID format"
+        )
     
-    order_items = []
-    subtotal = 0.0
-    tax_total = 0.0
+    entry = get_collection(QUEUE_COLLECTION).find_one({"_id": object_id}, {"request": 0})
     
-    for item in order_data.items:
+    if not entry or (
+        current_user["role"] != UserRole.ADMIN.value and entry["user_id"] != current_user["user_id"]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Queued order not found"
+        )
+    
+    return queue_entry_to_response(entry)
+
+
+@router.patch("/status", response_model=BulkOrderStatusResponse)
+async def bulk_update_order_status(
+    update: BulkOrderStatusUpdate,
+    current_user: dict = Depends(require_admin)
+):
+    if len(update.order_ids) > settings.ORDER_BULK_STATUS_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.ORDER_BULK_STATUS_MAX} orders per request"
+        )
+    
+    order_ids = list(dict.fromkeys(update.order_ids))
+    results = {}
+    object_ids = {}
+    for order_id in order_ids:
         try:
-            product_id = ObjectId(item.product_id)
+            object_ids[order_id] = ObjectId(order_id)
         except InvalidId:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid product ID: {item.product_id}"
-            )
-        
-        product = products_collection.find_one({"_id": product_id})
-        if not product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product not found: {item.product_id}"
-            )
-        
-        if product.get("stock", 0) < item.quantity:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient stock for product: {product['title']}"
+            results[order_id] = BulkOrderStatusResult(order_id=order_id, status="invalid", error="Invalid order ID format")
+    
+    orders_collection = get_collection("orders")
+    orders = {order["_id"]: order for order in orders_collection.find({"_id": {"$in": list(object_ids.values())}})}
+    
+    now = datetime.utcnow()
+    # Stamped on every write of this request, so the orders it moved can be
+    # found again even if they have moved on since.
+    write_token = ObjectId()
+    writes = []
+    pending = {}
+    for order_id, object_id in object_ids.items():
+        order = orders.get(object_id)
+        if not order:
+            results[order_id] = BulkOrderStatusResult(order_id=order_id, status="not_found", error="Order not found")
+            continue
+        previous_status = OrderStatus(order["status"])
+        if update.status not in ORDER_TRANSITIONS[previous_status]:
+            results[order_id] = BulkOrderStatusResult(
+                order_id=order_id,
+                status="invalid_transition",
+                previous_status=previous_status,
+                error=f"Cannot change order status from {previous_status.value} to {update.status.value}"
             )
-        
-        item_subtotal = product["price"] * item.quantity
-        item_tax = item_subtotal * (product.get("tax_percent", 0) / 100)
-        
-        order_items.append({
-            "product_id": item.product_id,
-            "title": product["title"],
-            "price": product["price"],
-            "quantity": item.quantity,
-            "tax_percent": product.get("tax_percent", 0)
+            continue
+        # Conditional on the status just validated, as in the single-order update.
+        writes.append(UpdateOne(
+            {"_id": object_id, "status": previous_status.value},
+            {"$set": {"status": update.status.value, "updated_at": now, "status_write": write_token}}
+        ))
+        pending[order_id] = order
+    
+    updated_orders = []
+    if writes:
+        result = orders_collection.bulk_write(writes, ordered=False)
+        applied = set(pending)
+        if result.modified_count < len(writes):
+            # Some orders moved concurrently; ours are the ones stamped by this write.
+            applied = {
+                str(order["_id"])
+                for order in orders_collection.find(
+                    {"_id": {"$in": [object_ids[order_id] for order_id in pending]}, "status_write": write_token},
+                    {"_id": 1}
+                )
+            }
+        for order_id, order in pending.items():
+            previous_status = OrderStatus(order["status"])
+            if order_id in applied:
+                results[order_id] = BulkOrderStatusResult(order_id=order_id, status="updated", previous_status=previous_status)
+                updated_orders.append(order)
+            else:
+                results[order_id] = BulkOrderStatusResult(
+                    order_id=order_id,
+                    status="conflict",
+                    previous_status=previous_status,
+                    error="Order status was changed concurrently"
+                )
+    
+    # Rollups and events for the whole batch at once.
+    if update.status == OrderStatus.CANCELLED and updated_orders:
+        restock_cancelled_orders(updated_orders)
+        record_orders_cancelled(updated_orders)
+    publish_many([
+        (EventType.ORDER_STATUS_CHANGED, str(order["_id"]), {
+            "order_number": order.get("orderNumber"),
+            "user_id": order["user_id"],
+            "previous_status": order["status"],
+            "status": update.status.value
         })
-        
-        subtotal += item_subtotal
-        tax_total += item_tax
-        
-        products_collection.update_one(
-            {"_id": product_id},
-            {"$inc": {"stock": -item.quantity}}
+        for order in updated_orders
+    ])
+    
+    updated = len(updated_orders)
+    return BulkOrderStatusResponse(
+        results=[results[order_id] for order_id in order_ids],
+        updated=updated,
+        failed=len(order_ids) - updated
+    )
+
+
+@router.patch("/{order_id}/status", response_model=OrderResponse)
+async def update_order_status(
+    order_id: str,
+    status_data: OrderStatusUpdate,
+    current_user: dict = Depends(require_admin)
+):
+    try:
+        object_id = ObjectId(order_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid order ID format"
         )
     
-    # Generate unique order number
-    order_number = f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    orders_collection = get_collection("orders")
+    order = orders_collection.find_one({"_id": object_id}, {"status": 1})
     
-    order_dict = {
-        "orderNumber": order_number,
-        "user_id": current_user["user_id"],
-        "items": order_items,
-        "subtotal": round(subtotal, 2),
-        "tax_total": round(tax_total, 2),
-        "total": round(subtotal + tax_total, 2),
-        "status": OrderStatus.PENDING.value,
-        "shipping_address": order_data.shipping_address,
-        "created_at": datetime.utcnow()
-    }
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    
+    previous_status = OrderStatus(order["status"])
+    if status_data.status not in ORDER_TRANSITIONS[previous_status]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot change order status from {previous_status.value} to {status_data.status.value}"
+        )
     
-    result = orders_collection.insert_one(order_dict)
-    created_order = orders_collection.find_one({"_id": result.inserted_id})
+    # Conditional on the status we validated against, so two admins can't
+    # both apply a transition from the same starting status.
+    updated_order = orders_collection.find_one_and_update(
+        {"_id": object_id, "status": previous_status.value},
+        {"$set": {"status": status_data.status.value, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
     
-    return order_to_response(created_order)
+    if not updated_order:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Order status was changed concurrently"
+        )
+    
+    if status_data.status == OrderStatus.CANCELLED:
+        restock_cancelled_orders([updated_order])
+        record_orders_cancelled([updated_order])
+    
+    publish(EventType.ORDER_STATUS_CHANGED, order_id, {
+        "order_number": updated_order.get("orderNumber"),
+        "user_id": updated_order["user_id"],
+        "previous_status": previous_status.value,
+        "status": status_data.status.value
+    })
+    
+    return order_to_response(updated_order)
 
 
 @router.post("/{order_id}/reorder", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
 async def reorder(
     order_id: str,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     current_user: dict = Depends(get_current_user)
 ):
     try:
@@ -173,8 +534,7 @@ async def reorder(
             detail="Invalid order ID format"
         )
     
-    orders_collection = get_collection("orders")
-    original_order = orders_collection.find_one({"_id": object_id})
+    original_order = find_order(object_id)
     
     if not original_order:
         raise HTTPException(
@@ -198,4 +558,10 @@ async def reorder(
         shipping_address=original_order.get("shipping_address")
     )
     
-    return await create_order(new_order_data, current_user)
+    return await run_idempotent(
+        idempotency_key,
+        current_user["user_id"],
+        request_fingerprint("reorder", order_id),
+        lambda: order_to_response(place_order(new_order_data, current_user["user_id"])),
+        status.HTTP_201_CREATED
+    )
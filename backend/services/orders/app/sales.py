@@ -0,0 +1,222 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.archive import ARCHIVE_COLLECTION
+from common.background import acquire_lease, release_lease
+from common.database import get_collection
+
+logger = logging.getLogger(__name__)
+
+DAILY_COLLECTION = "sales_daily"
+PRODUCT_DAILY_COLLECTION = "sales_product_daily"
+BACKFILL_JOB = "sales_backfill"
+
+# Days aggregated per backfill pass, to keep each aggregation bounded.
+BACKFILL_WINDOW = timedelta(days=7)
+BACKFILL_LEASE_SECONDS = 600
+
+CANCELLED = "cancelled"
+
+_backfill_lock = threading.Lock()
+
+
+def start_of_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """Stored dates are naive UTC; bring a timezone-aware query value in line."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def day_key(day: datetime) -> str:
+    return day.strftime("%Y-%m-%d")
+
+
+def _apply_orders(orders: List[dict], sign: int, cancelled: bool = False) -> None:
+    """Fold ``orders`` into per-day and per-product-day increments and apply them.
+
+    Orders on the same day or product share one update, so a batch costs
+    one bulk write per rollup collection however many orders it holds.
+    """
+    daily = defaultdict(lambda: defaultdict(int))
+    by_product = defaultdict(lambda: {"units": 0, "revenue": 0.0, "title": None})
+    for order in orders:
+        day = start_of_day(order["created_at"])
+        increments = daily[day]
+        increments["orders"] += sign
+        increments["revenue"] += sign * order["total"]
+        increments["subtotal"] += sign * order["subtotal"]
+        increments["tax"] += sign * order["tax_total"]
+        increments["units"] += sign * sum(item["quantity"] for item in order["items"])
+        if cancelled:
+            increments["cancelled_orders"] += 1
+            increments["cancelled_revenue"] += order["total"]
+        for item in order["items"]:
+            totals = by_product[(item["product_id"], day)]
+            totals["units"] += sign * item["quantity"]
+            totals["revenue"] += sign * item["price"] * item["quantity"]
+            totals["title"] = item.get("title")
+
+    if not daily:
+        return
+    get_collection(DAILY_COLLECTION).bulk_write([
+        UpdateOne(
+            {"_id": day_key(day)},
+            {"$inc": dict(increments), "$setOnInsert": {"day": day}},
+            upsert=True
+        )
+        for day, increments in daily.items()
+    ], ordered=False)
+    if not by_product:
+        return
+    get_collection(PRODUCT_DAILY_COLLECTION).bulk_write([
+        UpdateOne(
+            {"_id": f"{product_id}:{day_key(day)}"},
+            {
+                "$inc": {"units": totals["units"], "revenue": totals["revenue"]},
+                "$set": {"title": totals["title"]},
+                "$setOnInsert": {"product_id": product_id, "day": day}
+            },
+            upsert=True
+        )
+        for (product_id, day), totals in by_product.items()
+    ], ordered=False)
+
+
+def record_order_sales(order: dict) -> None:
+    """Add a newly placed order to its day's rollups.
+
+    Rollups are reporting data, so a failed write is logged rather than
+    failing the order; a backfill repairs it.
+    """
+    try:
+        _apply_orders([order], 1)
+    except PyMongoError:
+        logger.exception("Failed to update sales rollups for order %s", order.get("_id"))
+
+
+def record_orders_cancelled(orders: List[dict]) -> None:
+    """Take cancelled orders back out of their days' revenue and unit totals."""
+    try:
+        _apply_orders(orders, -1, cancelled=True)
+    except PyMongoError:
+        logger.exception("Failed to update sales rollups for %d cancelled orders", len(orders))
+
+
+def rebuild_sales_rollups(since: datetime, until: datetime) -> None:
+    """Recompute rollups for whole days of orders created in [since, until), hot and archived.
+
+    The window's rollup documents are dropped first, so days and products
+    that no longer have orders don't keep stale rows.
+    """
+    orders_collection = get_collection("orders")
+    window = {"created_at": {"$gte": since, "$lt": until}}
+    for name in (DAILY_COLLECTION, PRODUCT_DAILY_COLLECTION):
+        get_collection(name).delete_many({"day": {"$gte": since, "$lt": until}})
+    is_cancelled = {"$eq": ["$status", CANCELLED]}
+    day = {"$dateTrunc": {"date": "$created_at", "unit": "day"}}
+
+    orders_collection.aggregate([
+        {"$match": window},
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": window}]}},
+        {"$group": {
+            "_id": day,
+            "orders": {"$sum": {"$cond": [is_cancelled, 0, 1]}},
+            "revenue": {"$sum": {"$cond": [is_cancelled, 0, "$total"]}},
+            "subtotal": {"$sum": {"$cond": [is_cancelled, 0, "$subtotal"]}},
+            "tax": {"$sum": {"$cond": [is_cancelled, 0, "$tax_total"]}},
+            "units": {"$sum": {"$cond": [is_cancelled, 0, {"$sum": "$items.quantity"}]}},
+            "cancelled_orders": {"$sum": {"$cond": [is_cancelled, 1, 0]}},
+            "cancelled_revenue": {"$sum": {"$cond": [is_cancelled, "$total", 0]}}
+        }},
+        {"$set": {"day": "$_id", "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id"}}}},
+        {"$merge": {"into": DAILY_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ], allowDiskUse=True)
+
+    orders_collection.aggregate([
+        {"$match": {**window, "status": {"$ne": CANCELLED}}},
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": {**window, "status": {"$ne": CANCELLED}}}]}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"product_id": "$items.product_id", "day": day},
+            "units": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}},
+            "title": {"$last": "$items.title"}
+        }},
+        {"$project": {
+            "_id": {"$concat": [
+                "$_id.product_id", ":",
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$_id.day"}}
+            ]},
+            "product_id": "$_id.product_id",
+            "day": "$_id.day",
+            "units": 1,
+            "revenue": 1,
+            "title": 1
+        }},
+        {"$merge": {"into": PRODUCT_DAILY_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ], allowDiskUse=True)
+
+
+def run_sales_backfill(since: Optional[datetime] = None) -> None:
+    """Rebuild rollups from ``since`` (default: the first order) a window at a time."""
+    if since is None:
+        oldest = [
+            order["created_at"]
+            for order in (
+                get_collection(name).find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+                for name in ("orders", ARCHIVE_COLLECTION)
+            )
+            if order
+        ]
+        if not oldest:
+            return
+        since = min(oldest)
+    since = start_of_day(since)
+    # Today is left to the live $inc updates; replacing it would drop any
+    # that landed while the window was being aggregated.
+    until = start_of_day(datetime.utcnow())
+
+    try:
+        while since < until:
+            # Renew the lease each window so a long backfill keeps it.
+            if not acquire_lease(BACKFILL_JOB, BACKFILL_LEASE_SECONDS):
+                return
+            window_end = min(since + BACKFILL_WINDOW, until)
+            rebuild_sales_rollups(since, window_end)
+            since = window_end
+    finally:
+        release_lease(BACKFILL_JOB)
+
+
+def start_sales_backfill(since: Optional[datetime] = None) -> bool:
+    """Run the backfill on a background thread unless one is already running.
+
+    The lease keeps other replicas out; it is re-acquirable by this process,
+    so the lock keeps out a second backfill here.
+    """
+    if not _backfill_lock.acquire(blocking=False):
+        return False
+    if not acquire_lease(BACKFILL_JOB, BACKFILL_LEASE_SECONDS):
+        _backfill_lock.release()
+        return False
+
+    def run():
+        try:
+            run_sales_backfill(since)
+        except Exception:
+            logger.exception("Sales rollup backfill failed")
+        finally:
+            _backfill_lock.release()
+
+    threading.Thread(target=run, name=BACKFILL_JOB, daemon=True).start()
+    return True
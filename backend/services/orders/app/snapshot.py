@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from app.archive import ARCHIVABLE_STATUSES, ARCHIVE_COLLECTION
+from app.models import OrderStatus
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "current.json"
+EPOCH = datetime(1970, 1, 1)
+
+# Codes stored in the order_status column.
+STATUSES = [order_status.value for order_status in OrderStatus]
+
+# One .npy file per column; the typecode is both the array.array code used
+# while reading orders and the NumPy dtype written to disk.
+ORDER_COLUMNS = {
+    "order_created": "q",   # seconds since the epoch, UTC
+    "order_status": "b",    # index into STATUSES
+    "order_subtotal": "d",
+    "order_tax": "d",
+    "order_total": "d",
+    "order_units": "i",
+    "order_lines": "i"
+}
+ITEM_COLUMNS = {
+    "item_order": "i",      # row of the item's order in the order columns
+    "item_product": "i",    # index into the manifest's products
+    "item_category": "i",   # index into the manifest's categories, -1 if unknown
+    "item_quantity": "i",
+    "item_price": "d",
+    "item_tax": "d"
+}
+
+SNAPSHOT_PROJECTION = {
+    "created_at": 1,
+    "status": 1,
+    "subtotal": 1,
+    "tax_total": 1,
+    "total": 1,
+    "items.product_id": 1,
+    "items.quantity": 1,
+    "items.price": 1,
+    "items.tax_percent": 1
+}
+
+
+def epoch_seconds(moment: datetime) -> int:
+    """Seconds since the epoch; naive datetimes are UTC, as pymongo returns them."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((moment - EPOCH).total_seconds())
+
+
+class OrderSnapshot:
+    """A read-only, memory-mapped columnar copy of every order and order item."""
+
+    def __init__(self, path: str, manifest: dict):
+        self.path = path
+        self.version = manifest["version"]
+        self.created_at = datetime.fromisoformat(manifest["created_at"])
+        self.products = manifest["products"]
+        self.categories = manifest["categories"]
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in (*ORDER_COLUMNS, *ITEM_COLUMNS)
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(self.columns["order_created"])
+
+
+def write_snapshot() -> dict:
+    """Flatten hot and archived orders into a new snapshot and make it current.
+
+    Columns are accumulated in typed arrays while the cursor streams, so the
+    build holds a few bytes per order rather than the documents themselves.
+    Readers switch over when the manifest is replaced, which is atomic.
+
+    The archiver can move an order between the two scans, so archived
+    orders already read from the hot collection are skipped. Only terminal
+    orders can move, so only their ids are remembered.
+    """
+    columns = {name: array(code) for name, code in {**ORDER_COLUMNS, **ITEM_COLUMNS}.items()}
+    status_codes = {order_status: code for code, order_status in enumerate(STATUSES)}
+    product_codes: Dict[str, int] = {}
+    product_rows = array("i")
+
+    archivable = set(ARCHIVABLE_STATUSES)
+    seen_archivable = set()
+    row = 0
+    for collection in (get_collection("orders"), get_collection(ARCHIVE_COLLECTION)):
+        archived = collection.name == ARCHIVE_COLLECTION
+        for order in collection.find({}, SNAPSHOT_PROJECTION, batch_size=5000):
+            if archived:
+                if order["_id"] in seen_archivable:
+                    continue
+            elif order.get("status") in archivable:
+                seen_archivable.add(order["_id"])
+            items = order.get("items") or []
+            units = 0
+            for item in items:
+                product_code = product_codes.setdefault(item["product_id"], len(product_codes))
+                quantity = item["quantity"]
+                line_total = item["price"] * quantity
+                columns["item_order"].append(row)
+                product_rows.append(product_code)
+                columns["item_quantity"].append(quantity)
+                columns["item_price"].append(item["price"])
+                columns["item_tax"].append(line_total * item.get("tax_percent", 0) / 100)
+                units += quantity
+            columns["order_created"].append(epoch_seconds(order["created_at"]))
+            columns["order_status"].append(status_codes.get(order.get("status"), -1))
+            columns["order_subtotal"].append(order.get("subtotal", 0))
+            columns["order_tax"].append(order.get("tax_total", 0))
+            columns["order_total"].append(order.get("total", 0))
+            columns["order_units"].append(units)
+            columns["order_lines"].append(len(items))
+            row += 1
+
+    # Items are tagged with the product's current category, from one $in read.
+    products = list(product_codes)
+    category_of = {
+        str(product["_id"]): product.get("category_id")
+        for product in get_collection("products").find(
+            {"_id": {"$in": [ObjectId(product_id) for product_id in products if ObjectId.is_valid(product_id)]}},
+            {"category_id": 1}
+        )
+    }
+    categories = sorted({category_id for category_id in category_of.values() if category_id})
+    category_codes = {category_id: code for code, category_id in enumerate(categories)}
+    product_category = np.array(
+        [category_codes.get(category_of.get(product_id), -1) for product_id in products],
+        dtype=np.int32
+    )
+
+    arrays = {name: np.frombuffer(column, dtype=column.typecode) for name, column in columns.items()}
+    arrays["item_product"] = np.frombuffer(product_rows, dtype=product_rows.typecode)
+    arrays["item_category"] = product_category[arrays["item_product"]]
+
+    now = datetime.utcnow()
+    version = now.strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(settings.ORDER_SNAPSHOT_DIR, version)
+    os.makedirs(path)
+    for name, values in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+
+    manifest = {
+        "version": version,
+        "created_at": now.isoformat(),
+        "orders": row,
+        "items": len(arrays["item_order"]),
+        "statuses": STATUSES,
+        "products": products,
+        "categories": categories
+    }
+    manifest_path = os.path.join(settings.ORDER_SNAPSHOT_DIR, MANIFEST)
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    _prune(keep={version, _stats["version"]})
+    _stats["version"] = version
+    _stats["orders"] = row
+    _stats["items"] = manifest["items"]
+    logger.info("Wrote order snapshot %s: %d orders, %d items", version, row, manifest["items"])
+    return manifest
+
+
+def _prune(keep: set) -> None:
+    # The previous snapshot is kept for readers still mapping it.
+    for entry in os.listdir(settings.ORDER_SNAPSHOT_DIR):
+        path = os.path.join(settings.ORDER_SNAPSHOT_DIR, entry)
+        if os.path.isdir(path) and entry not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_build_lock = threading.Lock()
+
+
+def refresh_order_snapshot() -> None:
+    """Rebuild the snapshot unless a build is already running in this process."""
+    if not _build_lock.acquire(blocking=False):
+        return
+    try:
+        os.makedirs(settings.ORDER_SNAPSHOT_DIR, exist_ok=True)
+        write_snapshot()
+    finally:
+        _build_lock.release()
+
+
+def start_order_snapshot() -> bool:
+    """Build a snapshot on a background thread; False if one is already being built."""
+    if _build_lock.locked():
+        return False
+
+    def run():
+        try:
+            refresh_order_snapshot()
+        except Exception:
+            logger.exception("Order snapshot failed")
+
+    threading.Thread(target=run, name="order-snapshot", daemon=True).start()
+    return True
+
+
+_current: Optional[OrderSnapshot] = None
+_current_mtime: Optional[int] = None
+_current_lock = threading.Lock()
+
+
+def load_snapshot() -> Optional[OrderSnapshot]:
+    """The current snapshot, reopened only when the manifest has been replaced."""
+    global _current, _current_mtime
+    manifest_path = os.path.join(settings.ORDER_SNAPSHOT_DIR, MANIFEST)
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _current_lock:
+        if _current is None or mtime != _current_mtime:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            _current = OrderSnapshot(os.path.join(settings.ORDER_SNAPSHOT_DIR, manifest["version"]), manifest)
+            _current_mtime = mtime
+        return _current
+
+
+_stats = {"version": None, "orders": 0, "items": 0}
+
+register_collector("order_snapshot", lambda: dict(_stats))
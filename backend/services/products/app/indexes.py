@@ -0,0 +1,14 @@
+from common.database import get_collection
+
+
+def ensure_indexes():
+    products_collection = get_collection("products")
+    # sort=popular, overall and within a category; also the decay job's scan.
+    products_collection.create_index([("popularity", -1), ("_id", 1)], name="products_popularity")
+    products_collection.create_index(
+        [("category_id", 1), ("popularity", -1), ("_id", 1)],
+        name="products_category_popularity"
+    )
+
+    # Loading or pruning related products by build.
+    get_collection("product_related").create_index("version", name="related_version")
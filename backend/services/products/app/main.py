@@ -1,15 +1,55 @@
+import threading
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
+from common.events import start_event_listener, stop_event_listener
 from common.config import settings
+from common.background import PeriodicTask
+from common.metrics import collect_metrics
 from app.routes import router
+from app.indexes import ensure_indexes
+from common.catalog_changes import ensure_catalog_versions
+from app.related import has_related_build, rebuild_related_products, related_index
+from common.popularity import decay_popularity, popularity_counters
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    ensure_indexes()
+    ensure_catalog_versions()
+    start_event_listener()
+    related_task = PeriodicTask(
+        "related_products",
+        settings.RELATED_PRODUCTS_INTERVAL_SECONDS,
+        rebuild_related_products,
+        singleton=True
+    )
+    related_task.start()
+    if not has_related_build():
+        # A fresh deployment builds now rather than an interval after startup;
+        # the task's lease keeps it to one replica.
+        threading.Thread(target=related_task.run_once, name="related-products-initial", daemon=True).start()
+    # Every replica picks up a new build from the collection.
+    reload_task = PeriodicTask("related_products_reload", settings.RELATED_PRODUCTS_RELOAD_SECONDS, related_index.reload)
+    reload_task.start()
+    flush_task = PeriodicTask("popularity_flush", settings.POPULARITY_FLUSH_SECONDS, popularity_counters.flush)
+    flush_task.start()
+    decay_task = PeriodicTask(
+        "popularity_decay",
+        settings.POPULARITY_DECAY_INTERVAL_SECONDS,
+        decay_popularity,
+        singleton=True
+    )
+    decay_task.start()
     yield
+    decay_task.stop()
+    flush_task.stop()
+    popularity_counters.flush()
+    reload_task.stop()
+    related_task.stop()
+    stop_event_listener()
     close_mongo_connection()
 
 
@@ -34,4 +74,9 @@ async def health_check():
     return {"status": "healthy", "service": "products"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/products")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 
 
@@ -34,6 +34,7 @@ class ProductUpdate(BaseModel):
 class ProductResponse(ProductBase):
     id: str
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -45,3 +46,41 @@ class ProductListResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+
+
+class RelatedProduct(BaseModel):
+    product_id: str
+    # Orders containing both products, and that count normalised by how
+    # often each product is ordered.
+    count: int
+    score: float
+
+
+class RelatedProductsResponse(BaseModel):
+    product_id: str
+    related: List[RelatedProduct]
+    updated_at: Optional[datetime] = None
+
+
+class CategoryChange(BaseModel):
+    id: str
+    name: str
+    logo: Optional[str] = None
+    description: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class DeletedEntity(BaseModel):
+    entity: Literal["product", "category"]
+    id: str
+
+
+class CatalogChangesResponse(BaseModel):
+    products: List[ProductResponse]
+    categories: List[CategoryChange]
+    deleted: List[DeletedEntity]
+    # Pass as ``since`` on the next call.
+    next_token: str
+    # More changes are waiting; call again straight away.
+    has_more: bool
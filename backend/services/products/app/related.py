@@ -0,0 +1,221 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne
+
+from common.config import settings
+from common.database import get_collection
+from common.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+RELATED_COLLECTION = "product_related"
+
+# Holds the version readers should load; a build only becomes visible once
+# all of its documents are written and this is switched to it.
+RELATED_BUILDS_COLLECTION = "product_related_builds"
+CURRENT_BUILD_ID = "current"
+
+# Order history lives in the hot orders collection and the orders service's archive.
+ORDER_COLLECTIONS = ("orders", "orders_archive")
+
+# Orders read per chunk; each chunk's pairs are counted and merged before the next.
+CHUNK_ORDERS = 100000
+WRITE_BATCH = 1000
+
+
+def _basket_pairs(baskets: np.ndarray, codes: np.ndarray, max_basket: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct products per basket, and every ordered pair of them as ``a << 32 | b``.
+
+    Baskets of the same size are stacked into a matrix so each size's pairs
+    come from one fancy-indexing pass rather than a loop per order.
+    """
+    order = np.lexsort((codes, baskets))
+    baskets, codes = baskets[order], codes[order]
+    distinct = np.ones(len(codes), dtype=bool)
+    distinct[1:] = (baskets[1:] != baskets[:-1]) | (codes[1:] != codes[:-1])
+    baskets, codes = baskets[distinct], codes[distinct]
+
+    _, starts, sizes = np.unique(baskets, return_index=True, return_counts=True)
+    keys = []
+    for size in np.unique(sizes).tolist():
+        if size < 2 or size > max_basket:
+            continue
+        matrix = codes[starts[sizes == size][:, None] + np.arange(size)]
+        first, second = np.triu_indices(size, 1)
+        a = matrix[:, first].ravel()
+        b = matrix[:, second].ravel()
+        keys.append((a << 32) | b)
+        keys.append((b << 32) | a)
+    pairs = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+    return codes, pairs
+
+
+def _merge_counts(keys: np.ndarray, counts: np.ndarray, new_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    new_keys, new_counts = np.unique(new_keys, return_counts=True)
+    merged, inverse = np.unique(np.concatenate([keys, new_keys]), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([counts, new_counts])).astype(np.int64)
+
+
+def compute_related(top_k: int, min_count: int, max_basket: int) -> Tuple[List[str], Dict[int, list]]:
+    """Count product co-occurrence across non-cancelled orders and keep the top ``top_k`` per product.
+
+    Scores are cosine-normalised (co-occurrences over the geometric mean of
+    each product's order count) so best sellers don't top every list.
+    """
+    product_codes: Dict[str, int] = {}
+    frequency = np.zeros(0, dtype=np.int64)
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+
+    def flush(baskets, codes):
+        nonlocal frequency, keys, counts
+        distinct_codes, pairs = _basket_pairs(
+            np.asarray(baskets, dtype=np.int64), np.asarray(codes, dtype=np.int64), max_basket
+        )
+        chunk_frequency = np.bincount(distinct_codes, minlength=len(product_codes))
+        frequency = np.concatenate([frequency, np.zeros(len(chunk_frequency) - len(frequency), dtype=np.int64)])
+        frequency += chunk_frequency
+        if len(pairs):
+            keys, counts = _merge_counts(keys, counts, pairs)
+
+    baskets, codes = [], []
+    basket = 0
+    for name in ORDER_COLLECTIONS:
+        cursor = get_collection(name).aggregate([
+            {"$match": {"status": {"$ne": "cancelled"}}},
+            {"$project": {"_id": 0, "products": "$items.product_id"}}
+        ], batchSize=10000)
+        for order in cursor:
+            for product_id in order.get("products") or []:
+                baskets.append(basket)
+                codes.append(product_codes.setdefault(product_id, len(product_codes)))
+            basket += 1
+            if basket % CHUNK_ORDERS == 0:
+                flush(baskets, codes)
+                baskets, codes = [], []
+    flush(baskets, codes)
+
+    products = list(product_codes)
+    keep = counts >= min_count
+    keys, counts = keys[keep], counts[keep]
+    a = keys >> 32
+    b = keys & 0xFFFFFFFF
+    scores = counts / np.sqrt(frequency[a] * frequency[b])
+
+    # Best first within each product, then cut every group at top_k.
+    order = np.lexsort((-scores, a))
+    a, b, counts, scores = a[order], b[order], counts[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if len(a) else np.empty(0, dtype=np.int64)
+    ranks = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+    keep = ranks < top_k
+    a, b, counts, scores = a[keep], b[keep], counts[keep], scores[keep]
+
+    related = {}
+    bounds = np.flatnonzero(np.r_[True, a[1:] != a[:-1], True]) if len(a) else []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        related[int(a[start])] = [
+            {"product_id": products[code], "count": count, "score": round(score, 4)}
+            for code, count, score in zip(b[start:end].tolist(), counts[start:end].tolist(), scores[start:end].tolist())
+        ]
+    return products, related
+
+
+def rebuild_related_products() -> int:
+    """Recompute related products from the order history and swap them in."""
+    if not _build_lock.acquire(blocking=False):
+        return 0
+    try:
+        version = datetime.utcnow()
+        products, related = compute_related(
+            settings.RELATED_PRODUCTS_TOP_K,
+            settings.RELATED_PRODUCTS_MIN_COUNT,
+            settings.RELATED_PRODUCTS_MAX_BASKET
+        )
+        collection = get_collection(RELATED_COLLECTION)
+        writes = [
+            ReplaceOne({"_id": products[code]}, {"related": items, "version": version}, upsert=True)
+            for code, items in related.items()
+        ]
+        for start in range(0, len(writes), WRITE_BATCH):
+            collection.bulk_write(writes[start:start + WRITE_BATCH], ordered=False)
+        get_collection(RELATED_BUILDS_COLLECTION).update_one(
+            {"_id": CURRENT_BUILD_ID},
+            {"$set": {"version": version, "products": len(related)}},
+            upsert=True
+        )
+        # Products that no longer have related items drop out with the old
+        # version, as do leftovers of builds that failed partway.
+        collection.delete_many({"version": {"$ne": version}})
+
+        _stats["last_build_at"] = version.isoformat()
+        _stats["products"] = len(related)
+        related_index.reload()
+        return len(related)
+    finally:
+        _build_lock.release()
+
+
+def has_related_build() -> bool:
+    return get_collection(RELATED_BUILDS_COLLECTION).find_one({"_id": CURRENT_BUILD_ID}, {"_id": 1}) is not None
+
+
+def start_related_rebuild() -> bool:
+    """Rebuild on a background thread; False if a rebuild is already running here."""
+    if _build_lock.locked():
+        return False
+
+    def run():
+        try:
+            rebuild_related_products()
+        except Exception:
+            logger.exception("Related products rebuild failed")
+
+    threading.Thread(target=run, name="related-products", daemon=True).start()
+    return True
+
+
+class RelatedProductsIndex:
+    """In-memory copy of the current ``product_related`` build, reloaded when the build pointer moves."""
+
+    def __init__(self):
+        self.version: Optional[datetime] = None
+        self.loaded = False
+        self._related: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def reload(self) -> None:
+        current = get_collection(RELATED_BUILDS_COLLECTION).find_one({"_id": CURRENT_BUILD_ID}, {"version": 1})
+        version = current["version"] if current else None
+        with self._lock:
+            if self.loaded and version == self.version:
+                return
+            self._related = {
+                doc["_id"]: doc["related"]
+                for doc in get_collection(RELATED_COLLECTION).find({"version": version}, {"related": 1})
+            } if version else {}
+            self.version = version
+            self.loaded = True
+
+    def get(self, product_id: str, limit: int) -> List[dict]:
+        if not self.loaded:
+            self.reload()
+        return self._related.get(product_id, [])[:limit]
+
+    def stats(self) -> dict:
+        return {
+            **_stats,
+            "loaded_version": self.version.isoformat() if self.version else None,
+            "loaded_products": len(self._related)
+        }
+
+
+_build_lock = threading.Lock()
+_stats = {"last_build_at": None, "products": 0}
+
+related_index = RelatedProductsIndex()
+
+register_collector("related_products", related_index.stats)
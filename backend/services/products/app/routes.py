@@ -1,15 +1,43 @@
 from fastapi import APIRouter, Query, HTTPException, status, Depends
-from typing import Optional
+from typing import Literal, Optional
 from math import ceil
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
-from app.models import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse
+from app.models import (
+    ProductCreate, ProductUpdate, ProductResponse, ProductListResponse, RelatedProduct, RelatedProductsResponse,
+    CategoryChange, DeletedEntity, CatalogChangesResponse
+)
+from app.related import related_index, start_related_rebuild
 from common.database import get_collection
 from common.auth_middleware import require_admin
+from common.cache import get_cache
+from common.catalog_changes import decode_token, read_changes, record_tombstone, token_expired, versioned
+from common.category_stats import apply_product_change
+from common.config import settings
+from common.popularity import record_view
+from common.singleflight import coalesced_find_one
+from common.events import EventType, publish, publish_many, subscribe
 
 router = APIRouter(tags=["Products"])
 
+product_cache = get_cache(
+    "products",
+    l2=True,
+    ttl=settings.PRODUCT_CACHE_TTL_SECONDS,
+    max_bytes=settings.PRODUCT_CACHE_MAX_BYTES
+)
+
+
+def invalidate_product(event):
+    product_cache.delete(event.entity_id)
+
+
+subscribe(
+    [EventType.PRODUCT_UPDATED, EventType.PRODUCT_DELETED, EventType.STOCK_CHANGED],
+    invalidate_product
+)
+
 
 def product_to_response(product: dict) -> ProductResponse:
     return ProductResponse(
@@ -23,7 +51,8 @@ def product_to_response(product: dict) -> ProductResponse:
         stock=product.get("stock", 0),
         add_ons=product.get("add_ons", []),
         combos=product.get("combos", []),
-        created_at=product["created_at"]
+        created_at=product["created_at"],
+        updated_at=product.get("updated_at")
     )
 
 
@@ -31,7 +60,8 @@ def product_to_response(product: dict) -> ProductResponse:
 async def get_products(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
-    category_id: Optional[str] = Query(None, description="Filter by category")
+    category_id: Optional[str] = Query(None, description="Filter by category"),
+    sort: Literal["newest", "popular"] = Query("newest", description="popular ranks by recent views and cart adds")
 ):
     products_collection = get_collection("products")
     
@@ -44,7 +74,11 @@ async def get_products(
     
     skip = (page - 1) * limit
     
-    products_cursor = products_collection.find(query).skip(skip).limit(limit).sort("created_at", -1)
+    if sort == "popular":
+        order = [("popularity", -1), ("_id", 1)]
+    else:
+        order = [("created_at", -1)]
+    products_cursor = products_collection.find(query).skip(skip).limit(limit).sort(order)
     
     products = [product_to_response(product) for product in products_cursor]
     
@@ -57,6 +91,82 @@ async def get_products(
     )
 
 
+@router.get("/changes", response_model=CatalogChangesResponse)
+async def get_catalog_changes(
+    since: Optional[str] = Query(None, description="next_token from the previous call; omit for a full sync"),
+    limit: int = Query(500, ge=1, le=1000)
+):
+    since_token = None
+    if since is not None:
+        since_token = decode_token(since)
+        if since_token is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid change token"
+            )
+        if token_expired(since_token):
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Change token is too old; start a full sync without since"
+            )
+    
+    changes, next_token, has_more = read_changes(since_token, limit)
+    
+    products, categories, deleted = [], [], []
+    for kind, doc in changes:
+        if kind == "product":
+            products.append(product_to_response(doc))
+        elif kind == "category":
+            categories.append(CategoryChange(
+                id=str(doc["_id"]),
+                name=doc["name"],
+                logo=doc.get("logo"),
+                description=doc.get("description"),
+                created_at=doc["created_at"],
+                updated_at=doc.get("updated_at")
+            ))
+        else:
+            deleted.append(DeletedEntity(entity=doc["entity"], id=doc["entity_id"]))
+    
+    return CatalogChangesResponse(
+        products=products,
+        categories=categories,
+        deleted=deleted,
+        next_token=next_token,
+        has_more=has_more
+    )
+
+
+@router.post("/related/rebuild", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_related(current_user: dict = Depends(require_admin)):
+    if not start_related_rebuild():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A related products rebuild is already running"
+        )
+    return {"status": "started"}
+
+
+@router.get("/{product_id}/related", response_model=RelatedProductsResponse)
+async def get_related_products(
+    product_id: str,
+    limit: int = Query(10, ge=1, le=100)
+):
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid product ID format"
+        )
+    
+    related = related_index.get(product_id, limit)
+    
+    return RelatedProductsResponse(
+        product_id=product_id,
+        related=[RelatedProduct(**item) for item in related],
+        updated_at=related_index.version
+    )
+
+
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
     try:
@@ -67,8 +177,12 @@ async def get_product(product_id: str):
             detail="Invalid product ID format"
         )
     
-    products_collection = get_collection("products")
-    product = products_collection.find_one({"_id": object_id})
+    cached_product = product_cache.get(product_id)
+    if cached_product is not None:
+        record_view(product_id)
+        return cached_product
+    
+    product = await coalesced_find_one("products", {"_id": object_id})
     
     if not product:
         raise HTTPException(
@@ -76,7 +190,10 @@ async def get_product(product_id: str):
             detail="Product not found"
         )
     
-    return product_to_response(product)
+    record_view(product_id)
+    response = product_to_response(product)
+    product_cache.set(product_id, response)
+    return response
 
 
 @router.post("", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
@@ -89,9 +206,18 @@ async def create_product(
     product_dict = product_data.model_dump()
     product_dict["created_at"] = datetime.utcnow()
     
-    result = products_collection.insert_one(product_dict)
+    # Upserted rather than inserted so the server stamps its change version.
+    product_id = ObjectId()
+    products_collection.update_one({"_id": product_id}, versioned({"$setOnInsert": product_dict}), upsert=True)
+    
+    created_product = products_collection.find_one({"_id": product_id})
+    
+    apply_product_change(None, created_product)
+    publish(EventType.PRODUCT_CREATED, str(product_id), {
+        "category_id": created_product.get("category_id"),
+        "stock": created_product.get("stock", 0)
+    })
     
-    created_product = products_collection.find_one({"_id": result.inserted_id})
     return product_to_response(created_product)
 
 
@@ -128,10 +254,26 @@ async def update_product(
     
     products_collection.update_one(
         {"_id": object_id},
-        {"$set": update_data}
+        versioned({"$set": update_data})
     )
     
     updated_product = products_collection.find_one({"_id": object_id})
+    
+    apply_product_change(existing_product, updated_product)
+    events = [(EventType.PRODUCT_UPDATED, product_id, {
+        "fields": sorted(update_data),
+        "category_id": updated_product.get("category_id"),
+        "previous_category_id": existing_product.get("category_id")
+    })]
+    if "stock" in update_data:
+        events.append((EventType.STOCK_CHANGED, product_id, {
+            "previous_stock": existing_product.get("stock", 0),
+            "new_stock": updated_product.get("stock", 0),
+            "category_id": updated_product.get("category_id"),
+            "title": updated_product["title"]
+        }))
+    publish_many(events)
+    
     return product_to_response(updated_product)
 
 
@@ -150,12 +292,22 @@ async def delete_product(
     
     products_collection = get_collection("products")
     
-    result = products_collection.delete_one({"_id": object_id})
+    deleted_product = products_collection.find_one_and_delete(
+        {"_id": object_id},
+        projection={"category_id": 1, "stock": 1}
+    )
     
-    if result.deleted_count == 0:
+    if not deleted_product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
     
+    record_tombstone("product", product_id)
+    apply_product_change(deleted_product, None)
+    publish(EventType.PRODUCT_DELETED, product_id, {
+        "category_id": deleted_product.get("category_id"),
+        "stock": deleted_product.get("stock", 0)
+    })
+    
     return None
@@ -1,16 +1,32 @@
+import threading
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from common.database import connect_to_mongo, close_mongo_connection
+from common.events import start_event_listener, stop_event_listener
 from common.config import settings
+from common.metrics import collect_metrics
 from common.errors import setup_exception_handlers
+from common.background import PeriodicTask
 from app.routes import router
+from app.similar import similar_index
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     connect_to_mongo()
+    start_event_listener()
+    # Build the similarity index now rather than on the first request.
+    threading.Thread(target=similar_index.ensure_built, name="similar-products", daemon=True).start()
+    rebuild_task = PeriodicTask(
+        "similar_products_rebuild",
+        settings.SIMILAR_PRODUCTS_REBUILD_SECONDS,
+        similar_index.rebuild
+    )
+    rebuild_task.start()
     yield
+    rebuild_task.stop()
+    stop_event_listener()
     close_mongo_connection()
 
 
@@ -37,4 +53,9 @@ async def health_check():
     return {"status": "healthy", "service": "search"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
+
 app.include_router(router, prefix="/api/search")
@@ -18,3 +18,8 @@ class ProductResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class SimilarProductResponse(ProductResponse):
+    # Cosine similarity of the two products' text, 0-1.
+    score: float
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, status
 from typing import List
+import asyncio
 import re
-from app.models import ProductResponse
-from common.database import get_collection
+from bson import ObjectId
+from app.models import ProductResponse, SimilarProductResponse
+from app.similar import similar_index
+from common.singleflight import coalesced_find
 
 router = APIRouter(tags=["Search"])
 
+# Seconds a client is told to wait while the similarity index is first built.
+SIMILAR_INDEX_RETRY_AFTER = 5
+
 
 def product_to_response(product: dict) -> ProductResponse:
     return ProductResponse(
@@ -28,13 +34,11 @@ async def search_products(
     q: str = Query(..., min_length=1, description="Search query"),
     limit: int = Query(20, ge=1, le=100, description="Max results")
 ):
-    products_collection = get_collection("products")
-    categories_collection = get_collection("categories")
-    
     escaped_query = re.escape(q)
     regex_pattern = {"$regex": escaped_query, "$options": "i"}
     
-    matching_categories = categories_collection.find(
+    matching_categories = await coalesced_find(
+        "categories",
         {"name": regex_pattern},
         {"_id": 1}
     )
@@ -50,6 +54,48 @@ async def search_products(
     if category_ids:
         query["$or"].append({"category_id": {"$in": category_ids}})
     
-    products_cursor = products_collection.find(query).limit(limit)
+    # Most popular matches first.
+    products = await coalesced_find("products", query, limit=limit, sort=[("popularity", -1), ("_id", 1)])
+    
+    return [product_to_response(product) for product in products]
+
+
+@router.get("/similar/{product_id}", response_model=List[SimilarProductResponse])
+async def similar_products(
+    product_id: str,
+    limit: int = Query(10, ge=1, le=50, description="Max results")
+):
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid product ID format"
+        )
+    
+    if not similar_index.built:
+        # The startup build is still scanning the catalog.
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Similar products are still being indexed, please retry shortly",
+            headers={"Retry-After": str(SIMILAR_INDEX_RETRY_AFTER)}
+        )
+    
+    # The scoring pass and the index lock are kept off the event loop.
+    matches = await asyncio.to_thread(similar_index.similar, product_id, limit)
+    if matches is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    products = await coalesced_find(
+        "products",
+        {"_id": {"$in": [ObjectId(match_id) for match_id, _ in matches]}},
+        limit=len(matches)
+    )
+    by_id = {str(product["_id"]): product for product in products}
     
-    return [product_to_response(product) for product in products_cursor]
+    return [
+        SimilarProductResponse(**product_to_response(by_id[match_id]).model_dump(), score=round(score, 4))
+        for match_id, score in matches
+        if match_id in by_id
+    ]
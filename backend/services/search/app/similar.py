@@ -0,0 +1,201 @@
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from common.config import settings
+from common.database import get_collection
+from common.events import Event, EventType, subscribe
+from common.metrics import register_collector
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Title words count this many times over description words.
+TITLE_WEIGHT = 2
+
+TEXT_FIELDS = {"title", "description"}
+VECTOR_PROJECTION = {"title": 1, "description": 1}
+
+
+def _bucket(token: str, dim: int) -> Tuple[int, float]:
+    # crc32 rather than hash(): buckets must agree across processes and restarts.
+    # The top bit picks a sign so colliding tokens tend to cancel, not add up.
+    code = zlib.crc32(token.encode("utf-8"))
+    return code % dim, -1.0 if code & 0x80000000 else 1.0
+
+
+def term_vector(product: dict, dim: int) -> np.ndarray:
+    """Sublinear term frequencies of the product's title and description, hashed into ``dim`` buckets."""
+    counts = Counter()
+    for token in TOKEN_PATTERN.findall((product.get("title") or "").lower()):
+        counts[token] += TITLE_WEIGHT
+    for token in TOKEN_PATTERN.findall((product.get("description") or "").lower()):
+        counts[token] += 1
+    # Word pairs from the title, so "green tea" is closer to "green tea" than to "tea, green apple".
+    title_tokens = TOKEN_PATTERN.findall((product.get("title") or "").lower())
+    for first, second in zip(title_tokens, title_tokens[1:]):
+        counts[f"{first} {second}"] += TITLE_WEIGHT
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, count in counts.items():
+        bucket, sign = _bucket(token, dim)
+        vector[bucket] += sign * (1 + math.log(count))
+    return vector
+
+
+class SimilarProductsIndex:
+    """Hashed TF-IDF vectors for every product, one L2-normalised row each.
+
+    Similarity is a single matrix-vector product over the rows. Product
+    events update single rows in place using the IDF of the last full
+    build; the periodic rebuild refreshes the IDF itself.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.built = False
+        self.ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.term_vectors = np.zeros((0, dim), dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.updates = 0
+        self._lock = threading.RLock()
+        # Products changed while a rebuild was reading the catalog.
+        self._changed_during_rebuild: Optional[set] = None
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._changed_during_rebuild = set()
+        products = get_collection("products").find({}, VECTOR_PROJECTION)
+        ids = []
+        rows = []
+        for product in products:
+            ids.append(str(product["_id"]))
+            rows.append(term_vector(product, self.dim))
+        term_vectors = np.vstack(rows) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+        document_frequency = np.count_nonzero(term_vectors, axis=0)
+        idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        with self._lock:
+            self.ids = ids
+            self.rows = {product_id: row for row, product_id in enumerate(ids)}
+            self.free_rows = []
+            self.term_vectors = term_vectors
+            self.idf = idf
+            self.vectors = self._weigh(term_vectors)
+            self.built = True
+            changed, self._changed_during_rebuild = self._changed_during_rebuild, None
+
+        # The rebuild may have read these before they changed.
+        for product_id in changed:
+            refresh_product(product_id)
+
+    def _weigh(self, term_vectors: np.ndarray) -> np.ndarray:
+        weighted = term_vectors * self.idf
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return np.divide(weighted, norms, out=np.zeros_like(weighted), where=norms > 0)
+
+    def ensure_built(self) -> None:
+        if not self.built:
+            with self._lock:
+                if not self.built:
+                    self.rebuild()
+
+    def upsert(self, product_id: str, product: dict) -> None:
+        term = term_vector(product, self.dim)
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.add(product_id)
+            if not self.built:
+                return
+            row = self.rows.get(product_id)
+            if row is None:
+                row = self.free_rows.pop() if self.free_rows else self._grow()
+                self.ids[row] = product_id
+                self.rows[product_id] = row
+            self.term_vectors[row] = term
+            self.vectors[row] = self._weigh(term)
+            self.updates += 1
+
+    def _grow(self) -> int:
+        row = len(self.ids)
+        if row == len(self.vectors):
+            capacity = max(16, row * 2)
+            for name in ("term_vectors", "vectors"):
+                grown = np.zeros((capacity, self.dim), dtype=np.float32)
+                grown[:row] = getattr(self, name)[:row]
+                setattr(self, name, grown)
+        self.ids.append(None)
+        return row
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.add(product_id)
+            row = self.rows.pop(product_id, None)
+            if row is None:
+                return
+            # A zero row scores 0 against everything until it is reused.
+            self.ids[row] = None
+            self.term_vectors[row] = 0
+            self.vectors[row] = 0
+            self.free_rows.append(row)
+            self.updates += 1
+
+    def similar(self, product_id: str, limit: int) -> Optional[List[Tuple[str, float]]]:
+        """Top ``limit`` products by cosine similarity; None if the product isn't indexed."""
+        self.ensure_built()
+        with self._lock:
+            row = self.rows.get(product_id)
+            if row is None:
+                return None
+            count = len(self.ids)
+            scores = self.vectors[:count] @ self.vectors[row]
+            scores[row] = 0
+            limit = min(limit, count)
+            top = np.argpartition(-scores, limit - 1)[:limit] if limit else np.empty(0, dtype=np.int64)
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[index], float(scores[index])) for index in top.tolist() if scores[index] > 0]
+
+    def stats(self) -> dict:
+        return {
+            "built": self.built,
+            "products": len(self.rows),
+            "dimensions": self.dim,
+            "incremental_updates": self.updates,
+            "matrix_bytes": int(self.vectors.nbytes + self.term_vectors.nbytes)
+        }
+
+
+similar_index = SimilarProductsIndex(settings.SIMILAR_PRODUCTS_DIMENSIONS)
+
+
+def refresh_product(product_id: str) -> None:
+    product = get_collection("products").find_one({"_id": ObjectId(product_id)}, VECTOR_PROJECTION)
+    if product is None:
+        similar_index.remove(product_id)
+    else:
+        similar_index.upsert(product_id, product)
+
+
+def refresh_product_vector(event: Event) -> None:
+    if event.type == EventType.PRODUCT_DELETED:
+        similar_index.remove(event.entity_id)
+    elif event.type == EventType.PRODUCT_CREATED or TEXT_FIELDS & set(event.data.get("fields") or []):
+        refresh_product(event.entity_id)
+
+
+subscribe(
+    [EventType.PRODUCT_CREATED, EventType.PRODUCT_UPDATED, EventType.PRODUCT_DELETED],
+    refresh_product_vector
+)
+
+register_collector("similar_products", similar_index.stats)
@@ -5,7 +5,7 @@ import { Loader } from '../components';
 import api from '../api/axios';
 
 const Cart = () => {
-  const { cart, loading, updateQuantity, removeFromCart, clearCart } = useCart();
+  const { cart, loading, updateQuantity, removeFromCart, refreshCart } = useCart();
   const { isAuthenticated } = useAuth();
   
   const [checkoutLoading, setCheckoutLoading] = useState(false);
@@ -109,18 +109,13 @@ const Cart = () => {
 
     setCheckoutLoading(true);
     try {
-      const orderItems = cart.items.map(item => ({
-        product_id: item.product_id,
-        quantity: item.quantity
-      }));
-
-      const response = await api.post('/orders', {
-        items: orderItems,
+      // The server orders the cart and takes the ordered items out of it.
+      const response = await api.post('/orders/checkout', {
         shipping_address: shippingAddress
       });
 
       setOrderSuccess(response.data);
-      await clearCart();
+      await refreshCart();
     } catch (error) {
       const message = error.response?.data?.detail || 'Failed to place order';
       alert(message);